@@ -0,0 +1,64 @@
+"""
+Logging
+=======
+إعداد السجلات (logging) حسب المستوى LOG_LEVEL وبصيغة نصية أو JSON
+مع أخذ عينات من محتوى الـ Webhooks بدلاً من طباعتها كلها
+"""
+
+import os
+import json
+import logging
+import random
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Fraction of webhook payloads dumped at DEBUG level (0 = never, 1 = all)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 0.01))
+
+# LogRecord attributes that are not user-supplied ``extra`` fields
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra={...}`` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Configure the root logger once; safe to call again."""
+    root = logging.getLogger()
+    if getattr(root, "_webhooks_configured", False):
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(level)
+    root._webhooks_configured = True
+
+
+def log_payload(logger, payload, rate=None):
+    """Dump a webhook payload at DEBUG for a sampled fraction of requests."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = LOG_PAYLOAD_SAMPLE_RATE if rate is None else rate
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.debug("📩 Webhook: %s", json.dumps(payload, ensure_ascii=False))
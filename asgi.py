@@ -0,0 +1,207 @@
+"""
+ASGI Entry Point
+================
+تشغيل نفس السيرفر (نفس المسارات ولوحة التحكم ومنطق الرد) تحت uvicorn أو
+gunicorn مع عمال async: الـ Webhooks تُستقبل مباشرة في حلقة asyncio
+وطلبات Graph API تُرسل بدون حجز thread لكل طلب
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+POST /webhook is handled natively on the event loop (admission checks,
+then server.accept_webhook). Every other route is the Flask app from
+server.py, run on a thread pool through a small WSGI bridge, so the
+dashboard, API and webhook verification behave exactly as under WSGI.
+Replies still go through the delivery queue, but their Graph requests
+are sent by graph_async.AsyncGraphClient on this loop (needs aiohttp).
+"""
+
+import os
+import io
+import sys
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import metrics
+import server
+from graph_async import async_graph
+
+# Threads for Flask routes; every open dashboard holds one for /api/events
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 32))
+
+logger = logging.getLogger("webhooks")
+
+
+class WSGIBridge:
+    """Runs a WSGI app for ASGI HTTP requests on a thread pool.
+
+    The request body is read first; the app then runs and is iterated on
+    one pool thread (Flask's streamed responses keep their request context
+    on that thread), and each chunk is sent as soon as it is produced, so
+    Server-Sent Events stream as they do under gunicorn. Iteration stops
+    once the client disconnects.
+    """
+
+    def __init__(self, wsgi_app, threads=ASGI_WSGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        disconnected = threading.Event()
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = loop.create_task(watch())
+        try:
+            await loop.run_in_executor(self.executor, self._run, environ(scope, bytes(body)), send, loop, disconnected)
+        finally:
+            watcher.cancel()
+
+    def _run(self, environ, send, loop, disconnected):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start():
+            if not response.get("started"):
+                response["started"] = True
+                emit({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+
+        iterable = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in iterable:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    start()
+                    emit({"type": "http.response.body", "body": chunk, "more_body": True})
+            start()
+            emit({"type": "http.response.body", "body": b""})
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+
+def environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope (PEP 3333 strings are latin-1)."""
+    host, port = scope.get("server") or ("localhost", 80)
+    env = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": host,
+        "SERVER_PORT": str(port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        env["REMOTE_ADDR"], env["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        value = value.decode("latin-1")
+        env[key] = f"{env[key]},{value}" if key in env else value
+    return env
+
+
+async def respond(send, status, text):
+    body = text.encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def webhook(scope, receive, send):
+    """POST /webhook without a thread: same checks and dispatch as server.webhook_handler."""
+    if server.webhook_overloaded():
+        metrics.webhook_requests.inc(status=503)
+        return await respond(send, 503, "Busy")
+    headers = dict(scope.get("headers", []))
+    max_bytes = admission.WEBHOOK_MAX_BODY_KB * 1024
+    length = headers.get(b"content-length")
+    too_large = length is not None and length.isdigit() and int(length) > max_bytes
+    body = bytearray()
+    while not too_large:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        too_large = len(body) > max_bytes
+        if not message.get("more_body"):
+            break
+    if too_large:
+        metrics.webhook_requests.inc(status=413)
+        return await respond(send, 413, "Payload Too Large")
+    signature = headers.get(b"x-hub-signature-256")
+    client = scope.get("client") or ("", 0)
+    # Flask's before_request doesn't run here: pick up page and setting
+    # changes saved by another worker before deciding how to reply
+    server.sync_shared_state()
+    text, status = server.accept_webhook(bytes(body), signature.decode("latin-1") if signature else None, client[0])
+    await respond(send, status, text)
+
+
+async def lifespan(receive, send):
+    loop = asyncio.get_running_loop()
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await loop.run_in_executor(None, server.init_state)
+            if async_graph.start(loop):
+                logger.info("⚡ وضع ASGI: طلبات Graph غير متزامنة (حتى %d طلب متزامن)", async_graph.max_in_flight)
+            if not admission.APP_SECRET:
+                logger.warning("⚠️ APP_SECRET غير مضبوط: لن يتم التحقق من توقيع الـ Webhooks")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # Drain queued replies while the loop can still send them
+            await loop.run_in_executor(None, server.delivery_queue.shutdown)
+            await async_graph.stop()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+flask_app = WSGIBridge(server.app)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/webhook" and scope["method"] == "POST":
+        return await webhook(scope, receive, send)
+    await flask_app(scope, receive, send)
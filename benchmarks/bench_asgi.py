@@ -0,0 +1,185 @@
+"""
+WSGI vs ASGI benchmark
+======================
+يقارن قدرة server:app (gunicorn) و asgi:app (uvicorn) على تحمل طلبات
+متزامنة كثيرة عندما يكون Graph API بطيئاً
+
+    python benchmarks/bench_asgi.py [--requests 2000] [--concurrency 256]
+                                    [--workers 2] [--graph-latency-ms 300]
+
+Each mode runs as a real server process (gunicorn with gunicorn.conf.py,
+then uvicorn) in its own state directory against a fresh Graph simulator,
+and gets the same signed webhook traffic. Reported per mode: webhook
+throughput and ack latency, reply throughput and latency, and the peak
+number of Graph calls the simulator saw in flight at once, which is what
+the async Graph client is meant to raise.
+"""
+
+import os
+import sys
+import json
+import uuid
+import random
+import argparse
+import itertools
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from graph_simulator import GraphSimulator
+from loadtest import app_data, make_request, percentile, webhook_headers
+
+MODES = {
+    "wsgi": lambda port, workers: [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+                                   "--pythonpath", ROOT, "-b", f"127.0.0.1:{port}", "--log-level", "warning",
+                                   "server:app"],
+    "asgi": lambda port, workers: [sys.executable, "-m", "uvicorn", "asgi:app", "--app-dir", ROOT,
+                                   "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+                                   "--log-level", "warning", "--no-access-log"],
+}
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, graph_url, pages, workers):
+    directory = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+    with open(os.path.join(directory, "data.json"), "w", encoding="utf-8") as f:
+        json.dump(app_data(pages), f, ensure_ascii=False)
+    env = dict(os.environ, GRAPH_API_URL=graph_url, WEB_CONCURRENCY=str(workers), PYTHONPATH=ROOT)
+    for key, value in {"RATE_LIMIT": "0", "REPLY_BUDGET_POST": "0", "REPLY_BUDGET_PAGE": "0",
+                       "RETRY_BASE_DELAY": "0.05", "RETRY_MAX_DELAY": "1", "LOG_LEVEL": "WARNING"}.items():
+        env.setdefault(key, value)
+    if workers > 1:
+        env.setdefault("STATE_BACKEND", "sqlite")
+    port = free_port()
+    process = subprocess.Popen(MODES[mode](port, workers), cwd=directory, env=env)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{base}/login", timeout=1).status_code == 200:
+                return process, f"{base}/webhook"
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            sys.exit(f"{mode} server exited with code {process.returncode}")
+        time.sleep(0.2)
+    process.terminate()
+    sys.exit(f"{mode} server did not start")
+
+
+def run(mode, args, pages):
+    sim = GraphSimulator(args.graph_latency_ms, args.graph_jitter_ms)
+    process, webhook_url = start_server(mode, sim.start(), pages, args.workers)
+
+    run_id = uuid.uuid4().hex[:8]
+    counter = itertools.count()
+    bodies = [make_request(pages, run_id, counter, args.events, 0.3, 0.3) for _ in range(args.requests)]
+
+    local = threading.local()
+    lock = threading.Lock()
+    sent_at = {}
+    ack_latency = []
+    statuses = {}
+
+    def send(item):
+        body, keys = item
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = session.post(webhook_url, data=body, headers=webhook_headers(body), timeout=30).status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            ack_latency.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                for key in keys:
+                    sent_at[key] = start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send, bodies))
+    send_duration = time.perf_counter() - started
+
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        with sim.lock:
+            if all(key in sim.replies for key in sent_at):
+                break
+        time.sleep(0.05)
+    total_duration = time.perf_counter() - started
+
+    with sim.lock:
+        e2e = [sim.replies[key] - start for key, start in sent_at.items() if key in sim.replies]
+    report = {
+        "mode": mode,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "ack_rps": round(args.requests / send_duration, 1),
+        "ack_p50_ms": round(percentile(ack_latency, 50) * 1000, 2),
+        "ack_p99_ms": round(percentile(ack_latency, 99) * 1000, 2),
+        "replied": len(e2e),
+        "unreplied": len(sent_at) - len(e2e),
+        "reply_eps": round(len(e2e) / total_duration, 1),
+        "e2e_p50_ms": round(percentile(e2e, 50) * 1000, 2),
+        "e2e_p99_ms": round(percentile(e2e, 99) * 1000, 2),
+        "graph_peak_in_flight": sim.stats()["peak_in_flight"],
+    }
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    sim.stop()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=256, help="parallel webhook senders")
+    parser.add_argument("--events", type=int, default=2, help="events per request")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2, help="server processes per mode")
+    parser.add_argument("--graph-latency-ms", type=float, default=300)
+    parser.add_argument("--graph-jitter-ms", type=float, default=50)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--modes", default="wsgi,asgi")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    os.environ.setdefault("APP_SECRET", "bench-secret")
+    random.seed(1)
+    pages = [str(100000000000000 + i) for i in range(args.pages)]
+    reports = [run(mode, args, pages) for mode in args.modes.split(",")]
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+    print(f"{args.requests} requests x {args.events} events, {args.concurrency} concurrent senders, "
+          f"{args.workers} workers, Graph latency {args.graph_latency_ms:.0f} ms")
+    print(f"{'mode':<6} {'ack req/s':>10} {'ack p50':>9} {'ack p99':>9} {'replies/s':>10} {'e2e p50':>9} "
+          f"{'e2e p99':>9} {'graph in flight':>16}  statuses")
+    for r in reports:
+        print(f"{r['mode']:<6} {r['ack_rps']:>10} {r['ack_p50_ms']:>9} {r['ack_p99_ms']:>9} {r['reply_eps']:>10} "
+              f"{r['e2e_p50_ms']:>9} {r['e2e_p99_ms']:>9} {r['graph_peak_in_flight']:>16}  {r['statuses']}"
+              + (f" ({r['unreplied']} unreplied)" if r["unreplied"] else ""))
+
+
+if __name__ == "__main__":
+    main()
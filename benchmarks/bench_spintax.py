@@ -0,0 +1,57 @@
+"""
+Spintax micro-benchmark
+=======================
+يقارن التنفيذ القديم (re.search + re.sub في حلقة) مع القالب المُجمّع مسبقاً
+
+    python benchmarks/bench_spintax.py [--groups 20] [--iterations 20000]
+"""
+
+import os
+import sys
+import re
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from spintax import compile_template, render
+
+
+def legacy_process_spintax(text):
+    # The implementation server.py used before templates were precompiled
+    pattern = r'\{([^{}]+)\}'
+    def replace(match):
+        options = match.group(1).split('|')
+        return random.choice(options)
+    while re.search(pattern, text):
+        text = re.sub(pattern, replace, text, count=1)
+    return text
+
+
+def make_template(groups):
+    parts = []
+    for i in range(groups):
+        parts.append(f"كلمة{i} {{شكراً|نشكرك|ممتنون}} على {{تواصلك|تفاعلك|{{رأيك|تعليقك}}}}")
+    return " ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'groups':>8} {'legacy µs':>12} {'compiled µs':>12} {'compile µs':>12} {'speedup':>8}")
+    for groups in args.groups:
+        template = make_template(groups)
+        compiled = compile_template(template)
+        n = args.iterations
+        legacy = timeit.timeit(lambda: legacy_process_spintax(template), number=n) / n * 1e6
+        fast = timeit.timeit(lambda: render(compiled), number=n) / n * 1e6
+        compile_cost = timeit.timeit(lambda: compile_template(template), number=max(1, n // 10)) / max(1, n // 10) * 1e6
+        print(f"{groups:>8} {legacy:>12.1f} {fast:>12.1f} {compile_cost:>12.1f} {legacy / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Webhook parsing/logging benchmark
+=================================
+يقيس تكلفة كل طلب /webhook قبل وبعد إزالة الطباعة المنسقة للمحتوى
+
+    python benchmarks/bench_webhook_parse.py [--comments 10] [--iterations 5000]
+
+"before" = json.loads + json.dumps(indent=2) + print (the old handler)
+"after"  = fastjson.loads (orjson if installed) + sampled DEBUG dump
+"""
+
+import os
+import sys
+import io
+import json
+import logging
+import argparse
+import contextlib
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_payload(comments):
+    changes = [{
+        "field": "feed",
+        "value": {
+            "item": "comment",
+            "verb": "add",
+            "comment_id": f"123_{i}",
+            "post_id": "123_0",
+            "parent_id": "123_0",
+            "from": {"id": f"user{i}", "name": "مستخدم تجريبي"},
+            "message": "منتج رائع! كم السعر؟ 😍",
+            "created_time": 1700000000 + i,
+        },
+    } for i in range(comments)]
+    return json.dumps({"object": "page", "entry": [{"id": "123", "time": 1700000000, "changes": changes}]}).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comments", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    import fastjson
+    from app_logging import log_payload
+
+    sink = io.StringIO()
+    logger = logging.getLogger("bench")
+    logger.addHandler(logging.StreamHandler(sink))
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+
+    def before(body):
+        data = json.loads(body)
+        with contextlib.redirect_stdout(sink):
+            print(f"📩 Webhook: {json.dumps(data, indent=2)}")
+        sink.seek(0)
+        sink.truncate()
+
+    def after(body):
+        data = fastjson.loads(body)
+        log_payload(logger, data)
+
+    print(f"orjson: {'yes' if fastjson.orjson else 'no'}")
+    print(f"{'comments':>9} {'bytes':>8} {'before µs':>11} {'after µs':>10} {'speedup':>8}")
+    for comments in args.comments:
+        body = make_payload(comments)
+        n = args.iterations
+        t_before = timeit.timeit(lambda: before(body), number=n) / n * 1e6
+        t_after = timeit.timeit(lambda: after(body), number=n) / n * 1e6
+        print(f"{comments:>9} {len(body):>8} {t_before:>11.1f} {t_after:>10.1f} {t_before / t_after:>7.1f}x")
+
+    # Whole request through the Flask test client, delivery stubbed out
+    os.chdir(tempfile.mkdtemp())
+    logging.getLogger().setLevel(logging.WARNING)
+    import server
+    server.delivery_queue.submit = lambda func, *a, **kw: True
+    client = server.app.test_client()
+    body = make_payload(10)
+    n = max(1, args.iterations // 5)
+    t = timeit.timeit(lambda: client.post("/webhook", data=body, content_type="application/json"), number=n) / n * 1e6
+    print(f"\nfull /webhook request (10 comments, test client): {t:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
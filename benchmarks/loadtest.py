@@ -0,0 +1,243 @@
+"""
+Webhook load test
+=================
+يرسل أحداث feed/messaging واقعية إلى /webhook عبر HTTP، ويرد عليها
+graph_simulator.py بزمن استجابة ونسب أخطاء وتقييد قابلة للضبط
+
+    python benchmarks/loadtest.py [--requests 2000] [--concurrency 16]
+                                  [--events 1-5] [--graph-latency-ms 80]
+                                  [--graph-error-rate 0.02]
+
+Reports webhook throughput, p50/p99 ack latency (time until Facebook would
+get its 200) and p50/p99 end-to-end reply latency (webhook sent -> reply
+received by the Graph simulator). The Flask app runs in-process on a
+real socket with its own state directory; rate limiting is off unless
+RATE_LIMIT=1 is set, retries use short delays so injected errors
+settle quickly, and every request is signed like Facebook's.
+"""
+
+import os
+import sys
+import json
+import uuid
+import random
+import argparse
+import hashlib
+import hmac
+import itertools
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from graph_simulator import GraphSimulator
+
+MESSAGES = ["منتج رائع! كم السعر؟ 😍", "متوفر توصيل؟", "السلام عليكم", "بكم هذا؟", "👍", "تم الطلب"]
+NAMES = ["أحمد علي", "سارة محمد", "Mohamed Salah", "نور", "Test User"]
+
+
+# ============ Payloads ============
+def make_event(page_id, run_id, n, message_ratio, reply_chain_ratio):
+    """One webhook event; returns (kind, key, entry fragment)."""
+    created = int(time.time())
+    if random.random() < message_ratio:
+        sender = f"{run_id}u{n}"
+        return "message", sender, {"messaging": [{
+            "sender": {"id": sender},
+            "recipient": {"id": page_id},
+            "timestamp": created * 1000,
+            "message": {"mid": f"m_{run_id}{n}", "text": random.choice(MESSAGES)},
+        }]}
+    post_id = f"{page_id}_{random.randint(1, 50)}"
+    comment_id = f"{post_id}_{run_id}{n}"
+    parent_id = f"{post_id}_{run_id}p" if random.random() < reply_chain_ratio else post_id
+    return "comment", comment_id, {"changes": [{
+        "field": "feed",
+        "value": {
+            "item": "comment",
+            "verb": "add",
+            "comment_id": comment_id,
+            "post_id": post_id,
+            "parent_id": parent_id,
+            "from": {"id": f"{run_id}u{n}", "name": random.choice(NAMES)},
+            "message": random.choice(MESSAGES),
+            "created_time": created,
+        },
+    }]}
+
+
+def make_request(pages, run_id, counter, events, message_ratio, reply_chain_ratio):
+    """A webhook body with ``events`` events spread over random pages."""
+    entries = {}
+    keys = []
+    for _ in range(events):
+        page_id = random.choice(pages)
+        kind, key, fragment = make_event(page_id, run_id, next(counter), message_ratio, reply_chain_ratio)
+        entry = entries.setdefault(page_id, {"id": page_id, "time": int(time.time()), "changes": [], "messaging": []})
+        for field, items in fragment.items():
+            entry[field].extend(items)
+        keys.append(key)
+    return json.dumps({"object": "page", "entry": list(entries.values())}).encode(), keys
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# ============ Runner ============
+def webhook_headers(body):
+    """Headers Facebook sends, signed with the app secret start_app configured."""
+    signature = hmac.new(os.environ["APP_SECRET"].encode(), body, hashlib.sha256).hexdigest()
+    return {"Content-Type": "application/json", "X-Hub-Signature-256": f"sha256={signature}"}
+
+
+def app_data(pages):
+    """data.json contents: the given pages with dummy tokens, spintax templates, everything on."""
+    return {
+        "pages": [{"id": p, "name": f"Page {p}", "token": f"token-{p}"} for p in pages],
+        "comment_templates": ["{شكراً|نشكرك} على {تعليقك|تفاعلك} 🌹", "أهلاً {بك|بحضرتك}! تم الرد على الخاص"],
+        "message_templates": ["{مرحباً|أهلاً}! سيتواصل معك فريقنا {قريباً|خلال دقائق}"],
+        "settings": {"auto_reply_comments": True, "send_private_reply": True, "auto_reply_messages": True},
+    }
+
+
+def start_app(graph_url, pages):
+    os.environ["GRAPH_API_URL"] = graph_url
+    os.environ.setdefault("APP_SECRET", "loadtest-secret")
+    os.environ.setdefault("RATE_LIMIT", "0")
+    os.environ.setdefault("RETRY_BASE_DELAY", "0.05")
+    os.environ.setdefault("RETRY_MAX_DELAY", "1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(tempfile.mkdtemp(prefix="loadtest-"))
+
+    import server
+    from werkzeug.serving import make_server
+
+    server.data = app_data(pages)
+    server.rebuild_page_index()
+    server.compile_templates()
+    server.state.load()
+
+    httpd = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, name="webhook-app", daemon=True).start()
+    return server, httpd, f"http://127.0.0.1:{httpd.server_port}/webhook"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="webhook POSTs to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="parallel senders (like Facebook's delivery fan-out)")
+    parser.add_argument("--events", default="1-5", help="events per request, N or MIN-MAX")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--message-ratio", type=float, default=0.3, help="share of messaging events")
+    parser.add_argument("--reply-chain-ratio", type=float, default=0.3, help="share of comments that reply to a comment")
+    parser.add_argument("--graph-latency-ms", type=float, default=80)
+    parser.add_argument("--graph-jitter-ms", type=float, default=20)
+    parser.add_argument("--graph-error-rate", type=float, default=0.02, help="transient 500s (retried)")
+    parser.add_argument("--graph-throttle-rate", type=float, default=0.0, help="613 rate-limit errors (retried)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="seconds to wait for outstanding replies")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    low, _, high = args.events.partition("-")
+    low, high = int(low), int(high or low)
+
+    # Synthetic traffic measures raw throughput; replay.py keeps the budgets
+    os.environ.setdefault("REPLY_BUDGET_POST", "0")
+    os.environ.setdefault("REPLY_BUDGET_PAGE", "0")
+    sim = GraphSimulator(args.graph_latency_ms, args.graph_jitter_ms, args.graph_error_rate, args.graph_throttle_rate)
+    graph_url = sim.start()
+    pages = [str(100000000000000 + i) for i in range(args.pages)]
+    server, httpd, webhook_url = start_app(graph_url, pages)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    import requests
+
+    run_id = uuid.uuid4().hex[:8]
+    counter = itertools.count()
+    bodies = [make_request(pages, run_id, counter, random.randint(low, high),
+                           args.message_ratio, args.reply_chain_ratio) for _ in range(args.requests)]
+
+    local = threading.local()
+    sent_at = {}
+    ack_latency = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(item):
+        body, keys = item
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            status = session.post(webhook_url, data=body, headers=webhook_headers(body)).status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            ack_latency.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                for key in keys:
+                    sent_at[key] = start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send, bodies))
+    send_duration = time.perf_counter() - started
+
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        with sim.lock:
+            if all(key in sim.replies for key in sent_at):
+                break
+        time.sleep(0.05)
+    total_duration = time.perf_counter() - started
+
+    with sim.lock:
+        e2e = [sim.replies[key] - start for key, start in sent_at.items() if key in sim.replies]
+    graph_stats = sim.stats()
+    events = sum(len(keys) for _, keys in bodies)
+    report = {
+        "requests": args.requests,
+        "events": events,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "ack_throughput_rps": round(args.requests / send_duration, 1),
+        "ack_throughput_eps": round(events / send_duration, 1),
+        "ack_p50_ms": round(percentile(ack_latency, 50) * 1000, 2),
+        "ack_p99_ms": round(percentile(ack_latency, 99) * 1000, 2),
+        "replied": len(e2e),
+        "unreplied": len(sent_at) - len(e2e),
+        "reply_throughput_eps": round(len(e2e) / total_duration, 1),
+        "e2e_p50_ms": round(percentile(e2e, 50) * 1000, 2),
+        "e2e_p99_ms": round(percentile(e2e, 99) * 1000, 2),
+        "graph_calls": sum(graph_stats["calls"].values()),
+        "graph_injected_errors": sum(graph_stats["errors"].values()),
+        "graph_batch": server.graph_batcher.enabled,
+    }
+    httpd.shutdown()
+    sim.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"requests: {report['requests']}  events: {report['events']}  statuses: {report['statuses']}")
+    print(f"ack:   {report['ack_throughput_rps']} req/s, {report['ack_throughput_eps']} events/s, "
+          f"p50 {report['ack_p50_ms']} ms, p99 {report['ack_p99_ms']} ms")
+    print(f"reply: {report['replied']} replied, {report['unreplied']} missing, {report['reply_throughput_eps']} events/s, "
+          f"p50 {report['e2e_p50_ms']} ms, p99 {report['e2e_p99_ms']} ms")
+    print(f"graph: {report['graph_calls']} calls, {report['graph_injected_errors']} injected errors, "
+          f"batch={'on' if report['graph_batch'] else 'off'}")
+
+
+if __name__ == "__main__":
+    main()
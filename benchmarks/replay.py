@@ -0,0 +1,177 @@
+"""
+Webhook replay
+==============
+يعيد إرسال ملف Webhooks مسجّل (WEBHOOK_CAPTURE) إلى السيرفر بنفس توقيت
+وصوله الأصلي أو أسرع، مع محاكي Graph محلي، ويطبع الأداء وتوزيع زمن الرد
+
+    python benchmarks/replay.py captures/webhooks-*.jsonl.gz [--speed 1|10|max]
+                                [--graph-latency-ms 80] [--graph-error-rate 0.01]
+
+--speed 1 keeps the recorded inter-arrival gaps, --speed N compresses them
+N times and --speed max sends back to back. Pages found in the journal are
+configured with dummy tokens; the app runs in-process as in loadtest.py.
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from capture import read_journal
+from graph_simulator import GraphSimulator
+from loadtest import start_app, percentile, webhook_headers
+
+
+def reply_keys(body):
+    """Ids the app should reply to: comment ids and message senders."""
+    keys = []
+    for entry in body.get("entry", []):
+        page_id = entry.get("id")
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            if (change.get("field") == "feed" and value.get("item") == "comment" and value.get("verb") == "add"
+                    and value.get("from", {}).get("id") != page_id):
+                keys.append(value.get("comment_id"))
+        for messaging in entry.get("messaging", []):
+            sender_id = messaging.get("sender", {}).get("id")
+            if messaging.get("message") and sender_id != page_id:
+                keys.append(sender_id)
+    return keys
+
+
+def histogram(values, bounds=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)):
+    counts = [0] * (len(bounds) + 1)
+    for v in values:
+        for i, bound in enumerate(bounds):
+            if v <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f"<= {b}s" for b in bounds] + [f"> {bounds[-1]}s"]
+    return dict(zip(labels, counts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("journals", nargs="+", help="capture files (.jsonl.gz)")
+    parser.add_argument("--speed", default="1", help="replay speed multiplier, or 'max'")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--graph-latency-ms", type=float, default=80)
+    parser.add_argument("--graph-jitter-ms", type=float, default=20)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    parser.add_argument("--graph-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    records = sorted((t, body) for path in args.journals for t, body in read_journal(path))
+    if not records:
+        sys.exit("no webhook records found")
+    pages = sorted({entry.get("id") for _, body in records for entry in body.get("entry", []) if entry.get("id")})
+
+    sim = GraphSimulator(args.graph_latency_ms, args.graph_jitter_ms, args.graph_error_rate, args.graph_throttle_rate)
+    server, httpd, webhook_url = start_app(sim.start(), pages)
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    import requests
+
+    local = threading.local()
+    lock = threading.Lock()
+    sent_at = {}
+    ack_latency = []
+    statuses = {}
+    lag = [0.0]
+
+    def send(body, keys):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            data = json.dumps(body, ensure_ascii=False).encode()
+            status = session.post(webhook_url, data=data, headers=webhook_headers(data)).status_code
+        except requests.RequestException:
+            status = "error"
+        elapsed = time.perf_counter() - start
+        with lock:
+            ack_latency.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                for key in keys:
+                    sent_at.setdefault(key, start)
+
+    first = records[0][0]
+    recorded_span = records[-1][0] - first
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for t, body in records:
+            if speed:
+                delay = started + (t - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    lag[0] = max(lag[0], -delay)
+            pool.submit(send, body, reply_keys(body))
+    send_duration = time.perf_counter() - started
+
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        with sim.lock:
+            if all(key in sim.replies for key in sent_at):
+                break
+        time.sleep(0.05)
+    total_duration = time.perf_counter() - started
+
+    with sim.lock:
+        e2e = [sim.replies[key] - start for key, start in sent_at.items() if key in sim.replies]
+    events = sum(len(body.get("entry", [])) for _, body in records)
+    report = {
+        "requests": len(records),
+        "entries": events,
+        "recorded_seconds": round(recorded_span, 2),
+        "replay_seconds": round(send_duration, 2),
+        "speed": args.speed,
+        "max_schedule_lag_ms": round(lag[0] * 1000, 1),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "throughput_rps": round(len(records) / send_duration, 1) if send_duration else None,
+        "ack_p50_ms": round(percentile(ack_latency, 50) * 1000, 2),
+        "ack_p99_ms": round(percentile(ack_latency, 99) * 1000, 2),
+        "replied": len(e2e),
+        "unreplied": len(sent_at) - len(e2e),
+        "reply_throughput_eps": round(len(e2e) / total_duration, 1),
+        "e2e_p50_ms": round(percentile(e2e, 50) * 1000, 2),
+        "e2e_p90_ms": round(percentile(e2e, 90) * 1000, 2),
+        "e2e_p99_ms": round(percentile(e2e, 99) * 1000, 2),
+        "e2e_max_ms": round(max(e2e, default=0) * 1000, 2),
+        "e2e_histogram": histogram(e2e),
+        "graph": sim.stats(),
+    }
+    httpd.shutdown()
+    sim.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+    print(f"replayed {report['requests']} requests ({report['recorded_seconds']}s recorded) "
+          f"in {report['replay_seconds']}s at speed {report['speed']}, max lag {report['max_schedule_lag_ms']} ms")
+    print(f"ack:   {report['throughput_rps']} req/s, p50 {report['ack_p50_ms']} ms, p99 {report['ack_p99_ms']} ms, "
+          f"statuses {report['statuses']}")
+    print(f"reply: {report['replied']} replied, {report['unreplied']} missing, {report['reply_throughput_eps']} events/s, "
+          f"p50 {report['e2e_p50_ms']} ms, p90 {report['e2e_p90_ms']} ms, p99 {report['e2e_p99_ms']} ms, "
+          f"max {report['e2e_max_ms']} ms")
+    for label, count in report["e2e_histogram"].items():
+        print(f"  {label:>9} {count}")
+
+
+if __name__ == "__main__":
+    main()
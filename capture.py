@@ -0,0 +1,200 @@
+"""
+Webhook Capture
+===============
+تسجيل اختياري لمحتوى الـ Webhooks الواردة (بعد إخفاء البيانات الشخصية)
+في ملف JSONL مضغوط مع وقت الوصول، لإعادة تشغيله لاحقاً في اختبارات الأداء
+(benchmarks/replay.py)
+
+    WEBHOOK_CAPTURE=captures/webhooks-{pid}.jsonl.gz
+"""
+
+import os
+import atexit
+import gzip
+import json
+import hashlib
+import logging
+import queue
+import threading
+import time
+
+# Journal path; empty disables capture. {pid} keeps gunicorn workers in separate files
+WEBHOOK_CAPTURE = os.getenv("WEBHOOK_CAPTURE", "")
+WEBHOOK_CAPTURE_MAX_MB = float(os.getenv("WEBHOOK_CAPTURE_MAX_MB", 500))
+# Payloads waiting for the writer thread; more are dropped, never blocking the webhook
+WEBHOOK_CAPTURE_QUEUE = 10000
+# Longest the exit flush waits for the writer thread's last batch
+WEBHOOK_CAPTURE_FLUSH_TIMEOUT = 10
+
+# String fields that can hold user content; replaced by same-length filler
+REDACTED_TEXT_KEYS = {"message", "text", "name", "title", "caption", "url", "link", "email", "phone", "payload"}
+# Objects whose "id" identifies a person rather than a page or post
+USER_ID_KEYS = {"from", "sender", "recipient"}
+
+logger = logging.getLogger(__name__)
+
+
+def redact(payload, salt):
+    """Copy of a webhook body with user text masked and user ids pseudonymized.
+
+    Page, post and comment ids are kept so reply chains, per-page load and
+    duplicate deliveries replay the same way; a user id equal to the entry's
+    page id is also kept so self-comment filtering still applies.
+    """
+    entries = []
+    for entry in payload.get("entry", []) if isinstance(payload.get("entry"), list) else []:
+        page_id = entry.get("id") if isinstance(entry, dict) else None
+        entries.append(_redact(entry, salt, page_id))
+    return dict(_redact({k: v for k, v in payload.items() if k != "entry"}, salt, None), entry=entries)
+
+
+def _redact(value, salt, page_id, key=None):
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in USER_ID_KEYS and isinstance(v, dict):
+                out[k] = {ik: _pseudonym(iv, salt, page_id) if ik == "id" else _redact(iv, salt, page_id, ik)
+                          for ik, iv in v.items()}
+            else:
+                out[k] = _redact(v, salt, page_id, k)
+        return out
+    if isinstance(value, list):
+        return [_redact(v, salt, page_id, key) for v in value]
+    if isinstance(value, str) and key in REDACTED_TEXT_KEYS:
+        return "x" * len(value)
+    return value
+
+
+def _pseudonym(user_id, salt, page_id):
+    if user_id is None or user_id == page_id:
+        return user_id
+    digest = hashlib.sha256(f"{salt}:{user_id}".encode()).hexdigest()
+    return str(int(digest[:16], 16))[:16]
+
+
+class WebhookCapture:
+    """Appends ``{"t": arrival_time, "body": redacted}`` lines to a gzip journal.
+
+    ``record()`` only enqueues; redaction, compression and disk writes run
+    on a background thread. Each flush appends a new gzip member, so a
+    crash loses at most the last few lines and the file stays readable.
+    """
+
+    def __init__(self, path=WEBHOOK_CAPTURE, max_mb=WEBHOOK_CAPTURE_MAX_MB, queue_size=WEBHOOK_CAPTURE_QUEUE):
+        self.template = path
+        self.path = ""
+        self.enabled = bool(path)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.captured = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._salt = os.urandom(8).hex()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Payloads recorded but not yet written, including a batch in progress
+        self._pending = 0
+        self._written = threading.Condition()
+
+    def record(self, payload):
+        if not self.enabled:
+            return
+        self._ensure_started()
+        with self._written:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((time.time(), payload))
+        except queue.Full:
+            self.dropped += 1
+            self._done(1)
+
+    def _ensure_started(self):
+        # Threads don't survive fork and {pid} must name the worker, not the master
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                with self._written:
+                    self._pending = self._queue.qsize()
+                self.path = self.template.replace("{pid}", str(self._pid))
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            self._drain(items)
+
+    def _drain(self, items):
+        while len(items) < 500:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            with self._write_lock:
+                self._write(items)
+        except Exception as e:
+            logger.error("❌ فشل تسجيل الـ Webhooks: %s", e)
+        finally:
+            self._done(len(items))
+
+    def _done(self, count):
+        with self._written:
+            self._pending -= count
+            self._written.notify_all()
+
+    def flush(self, timeout=WEBHOOK_CAPTURE_FLUSH_TIMEOUT):
+        """Write whatever is still queued and wait for the writer thread's batch (at shutdown)."""
+        if self._thread is None:
+            return
+        while not self._queue.empty():
+            self._drain([])
+        # The writer thread may have taken the last items off the queue and
+        # still be writing them; returning now would cut that write short
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while self._pending > 0 and time.monotonic() < deadline:
+                self._written.wait(deadline - time.monotonic())
+
+    def _write(self, items):
+        if not items or not self.enabled:
+            return
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            logger.warning("⚠️ ملف التسجيل %s وصل للحد الأقصى، تم إيقاف التسجيل", self.path)
+            self.enabled = False
+            return
+        lines = "".join(
+            json.dumps({"t": round(t, 6), "body": redact(payload, self._salt)}, ensure_ascii=False) + "\n"
+            for t, payload in items
+        )
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(lines)
+        self.captured += len(items)
+
+    def stats(self):
+        return {"enabled": self.enabled, "path": self.path, "captured": self.captured,
+                "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+def read_journal(path):
+    """Yield ``(arrival_time, body)`` from a capture journal, tolerating a torn tail."""
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield record["t"], record["body"]
+    except (EOFError, gzip.BadGzipFile):
+        return
+
+
+webhook_capture = WebhookCapture()
+atexit.register(webhook_capture.flush)
@@ -0,0 +1,95 @@
+"""
+Dead Letter Store
+=================
+الطلبات التي فشلت نهائياً بعد كل المحاولات، محفوظة في ملف JSON Lines
+لعرضها وإعادة إرسالها من لوحة التحكم
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+
+DEAD_LETTER_FILE = "dead_letters.jsonl"
+DEAD_LETTER_MAX = int(os.getenv("DEAD_LETTER_MAX", 5000))
+
+
+class DeadLetterStore:
+    """Dead letters keyed by id, appended to a JSONL file.
+
+    Adds are one appended line. Taking or deleting entries is an operator
+    action, so it simply rewrites the file from memory.
+    """
+
+    def __init__(self, path=DEAD_LETTER_FILE, max_entries=DEAD_LETTER_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def load(self):
+        with self._lock:
+            self._entries.clear()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        self._entries[entry["id"]] = entry
+            except FileNotFoundError:
+                pass
+            self._trim()
+
+    def add(self, entry):
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self._entries[entry["id"]] = entry
+            if self._trim():
+                self._rewrite()
+
+    def list(self, limit):
+        with self._lock:
+            return list(self._entries.values())[-limit:]
+
+    def count(self):
+        return len(self._entries)
+
+    def take(self, ids=None):
+        """Remove and return the given entries (all of them when ``ids`` is None)."""
+        with self._lock:
+            if ids is None:
+                taken = list(self._entries.values())
+                self._entries.clear()
+            else:
+                taken = [self._entries.pop(i) for i in ids if i in self._entries]
+            if taken:
+                self._rewrite()
+            return taken
+
+    def _trim(self):
+        trimmed = False
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            trimmed = True
+        return trimmed
+
+    def _rewrite(self):
+        # Caller holds the lock
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+
+
+dead_letter_store = DeadLetterStore()
@@ -0,0 +1,126 @@
+"""
+Dedup Store
+===========
+فهرس التعليقات المعالجة لمنع الرد المكرر بعد إعادة التشغيل
+ترتيب حسب وقت الإضافة، مع انتهاء صلاحية (TTL) وحد أقصى للذاكرة
+"""
+
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+
+PROCESSED_FILE = "processed.jsonl"
+LEGACY_PROCESSED_FILE = "processed.json"
+DEDUP_TTL = float(os.getenv("DEDUP_TTL", 7 * 24 * 3600))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", 100000))
+
+
+class DedupStore:
+    """Insertion-ordered set of processed IDs backed by an append-only log.
+
+    Each ``add`` appends one ``[id, timestamp]`` line. Expired or
+    over-capacity IDs are evicted from the front of the ``OrderedDict``,
+    and the log is rewritten once dead lines outnumber live ones, so both
+    lookups and writes stay amortised O(1).
+    """
+
+    def __init__(self, path=PROCESSED_FILE, ttl=DEDUP_TTL, max_entries=DEDUP_MAX_ENTRIES,
+                 legacy_path=LEGACY_PROCESSED_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._file = None
+        self._lines = 0
+
+    def load(self):
+        with self._lock:
+            self._seen.clear()
+            self._lines = 0
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            item_id, ts = json.loads(line)
+                        except ValueError:
+                            continue
+                        self._lines += 1
+                        self._seen.pop(item_id, None)
+                        self._seen[item_id] = ts
+            except FileNotFoundError:
+                self._load_legacy()
+            self._evict(time.time())
+            if self._lines > len(self._seen) or not os.path.exists(self.path):
+                self._rewrite()
+
+    def _load_legacy(self):
+        # One-time migration from the old processed.json list
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                ids = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for item_id in ids:
+            self._seen[item_id] = now
+
+    def __len__(self):
+        return len(self._seen)
+
+    def items(self):
+        """``(id, timestamp)`` pairs, oldest first."""
+        with self._lock:
+            return list(self._seen.items())
+
+    def add(self, item_id):
+        """Mark ``item_id`` processed. Returns False if it already was."""
+        now = time.time()
+        with self._lock:
+            ts = self._seen.get(item_id)
+            if ts is not None and now - ts < self.ttl:
+                return False
+            self._seen.pop(item_id, None)
+            self._seen[item_id] = now
+            self._evict(now)
+            self._open().write(json.dumps([item_id, now]) + "\n")
+            self._file.flush()
+            self._lines += 1
+            if self._lines > 2 * len(self._seen) + 1000:
+                self._rewrite()
+            return True
+
+    def _evict(self, now):
+        # Caller holds the lock; oldest entries are always at the front
+        seen = self._seen
+        while seen:
+            item_id, ts = next(iter(seen.items()))
+            if len(seen) > self.max_entries or now - ts >= self.ttl:
+                seen.popitem(last=False)
+            else:
+                break
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _rewrite(self):
+        # Caller holds the lock
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for item_id, ts in self._seen.items():
+                f.write(json.dumps([item_id, ts]) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._lines = len(self._seen)
+
+
+dedup_store = DedupStore()
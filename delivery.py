@@ -0,0 +1,216 @@
+"""
+Background Delivery Queue
+=========================
+طابور خلفي لتنفيذ الردود بعيداً عن طلب الـ Webhook
+حتى يحصل Facebook على 200 OK فوراً، مقسّم اختيارياً لعدة طوابير
+مستقلة حسب الصفحة حتى لا تؤخر صفحة بطيئة أو مقيّدة باقي الصفحات
+"""
+
+import os
+import itertools
+import logging
+import queue
+import threading
+import time
+import zlib
+import atexit
+
+# Worker threads per shard
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", 4))
+# Total across shards; each shard gets an equal slice
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", 1000))
+# Independent queues keyed by page id; 1 keeps a single shared queue
+DELIVERY_SHARDS = int(os.getenv("DELIVERY_SHARDS", 1))
+DELIVERY_DRAIN_TIMEOUT = float(os.getenv("DELIVERY_DRAIN_TIMEOUT", 20))
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first; jobs of equal priority run in submission order
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = 1
+# Stop markers sort after all real work so shutdown drains the queue first
+_STOP_PRIORITY = float("inf")
+
+_STOP = object()
+
+
+class DeliveryQueue:
+    """Bounded priority job queue drained by a pool of daemon worker threads.
+
+    Workers are started lazily on the first submit so the pool is created
+    inside each gunicorn worker after fork, never in the master.
+    """
+
+    def __init__(self, workers=DELIVERY_WORKERS, maxsize=DELIVERY_QUEUE_SIZE, name="delivery"):
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.name = name
+        self._queue = queue.PriorityQueue(maxsize=maxsize)
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._in_flight = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.high_water = 0
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, func, *args, priority=PRIORITY_NORMAL):
+        """Queue ``func(*args)``. Returns False when the queue is full or closed."""
+        if self._closed:
+            self.rejected += 1
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((priority, next(self._counter), func, args))
+        except queue.Full:
+            self.rejected += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+            self.high_water = max(self.high_water, self._queue.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            _, _, func, args = self._queue.get()
+            if func is _STOP:
+                self._queue.task_done()
+                return
+            with self._lock:
+                self._in_flight += 1
+            try:
+                func(*args)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                logger.exception("❌ استثناء في طابور الإرسال (%s): %s", getattr(func, "__name__", func), e)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def free(self):
+        return self.maxsize - self._queue.qsize()
+
+    def stats(self):
+        return {
+            "workers": len(self._threads),
+            "depth": self._queue.qsize(),
+            "max_size": self.maxsize,
+            "in_flight": self._in_flight,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self, timeout=DELIVERY_DRAIN_TIMEOUT):
+        """Stop accepting work and let the workers drain what is queued."""
+        if not self._close():
+            return
+        logger.info("⏳ تفريغ طابور الإرسال (%d مهمة متبقية)...", self._queue.qsize())
+        if not self._join(time.monotonic() + timeout):
+            logger.warning("⚠️ انتهت مهلة التفريغ قبل إكمال كل المهام")
+
+    def _close(self):
+        """Reject new work and queue one stop marker per worker. True if workers are running."""
+        if self._closed:
+            return False
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put((_STOP_PRIORITY, next(self._counter), _STOP, ()))
+        return bool(self._threads)
+
+    def _join(self, deadline):
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+        return not any(t.is_alive() for t in self._threads)
+
+
+def shard_for(key, shards):
+    """Shard index for ``key``; stable across processes and restarts, unlike ``hash()``."""
+    return zlib.crc32(str(key).encode()) % shards
+
+
+class ShardedDeliveryQueue:
+    """``shards`` independent DeliveryQueues, each with its own workers.
+
+    Jobs submitted with the same ``key`` (the page id) always land on the
+    same shard, so a page that is slow or throttled only holds up the
+    pages hashed next to it. Within a shard jobs run by priority, so a
+    page's jobs are not guaranteed to run in arrival order (and retries
+    come back later). Jobs without a key are spread round robin.
+    """
+
+    def __init__(self, shards=DELIVERY_SHARDS, workers=DELIVERY_WORKERS, maxsize=DELIVERY_QUEUE_SIZE):
+        count = max(1, shards)
+        self.maxsize = maxsize
+        self.shards = [DeliveryQueue(workers, max(1, maxsize // count), name=f"delivery-{i}" if count > 1 else "delivery")
+                       for i in range(count)]
+        self._round_robin = itertools.count()
+
+    def index(self, key):
+        if key is None:
+            return next(self._round_robin) % len(self.shards)
+        return shard_for(key, len(self.shards))
+
+    def shard(self, key):
+        return self.shards[self.index(key)]
+
+    def submit(self, func, *args, key=None, priority=PRIORITY_NORMAL):
+        """Queue ``func(*args)`` on ``key``'s shard. Returns False when that shard is full or closed."""
+        return self.shard(key).submit(func, *args, priority=priority)
+
+    def depth(self):
+        return sum(shard.depth() for shard in self.shards)
+
+    def shard_depths(self):
+        return {str(i): shard.depth() for i, shard in enumerate(self.shards)}
+
+    @property
+    def rejected(self):
+        return sum(shard.rejected for shard in self.shards)
+
+    def stats(self):
+        per_shard = [shard.stats() for shard in self.shards]
+        totals = {key: sum(s[key] for s in per_shard)
+                  for key in ("workers", "depth", "in_flight", "enqueued", "processed", "failed", "rejected")}
+        totals.update(max_size=self.maxsize, high_water=max(s["high_water"] for s in per_shard))
+        if len(per_shard) > 1:
+            totals["shards"] = per_shard
+        return totals
+
+    def shutdown(self, timeout=DELIVERY_DRAIN_TIMEOUT):
+        """Stop every shard, then wait for all of them within one shared timeout."""
+        remaining = self.depth()
+        running = [shard for shard in self.shards if shard._close()]
+        if not running:
+            return
+        logger.info("⏳ تفريغ طابور الإرسال (%d مهمة متبقية)...", remaining)
+        deadline = time.monotonic() + timeout
+        if not all([shard._join(deadline) for shard in running]):
+            logger.warning("⚠️ انتهت مهلة التفريغ قبل إكمال كل المهام")
+
+
+delivery_queue = ShardedDeliveryQueue()
+atexit.register(delivery_queue.shutdown)
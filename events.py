@@ -0,0 +1,81 @@
+"""
+Dashboard Events
+================
+بث التحديثات (سجل جديد، عدادات، تغيير الصفحات والقوالب) للوحات التحكم
+المفتوحة عبر Server-Sent Events بدلاً من إعادة تحميل الصفحة
+"""
+
+import os
+import json
+import queue
+import threading
+
+# Events buffered per connected dashboard before it is told to resync
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", 500))
+# Each open stream holds a server thread; the default keeps two of the
+# GUNICORN_THREADS per worker free for /webhook and the dashboard API
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", max(1, int(os.getenv("GUNICORN_THREADS", 8)) - 2)))
+
+
+class Subscription:
+    def __init__(self, max_size):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.overflowed = False
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """In-process fan-out of ``(kind, data)`` events to subscribers.
+
+    ``publish`` never blocks: a subscriber whose queue is full is marked
+    ``overflowed`` and dropped, and its stream tells the browser to
+    reload instead of silently missing events.
+    """
+
+    def __init__(self, queue_size=EVENTS_QUEUE_SIZE, max_clients=EVENTS_MAX_CLIENTS):
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """A new Subscription, or None when ``max_clients`` are connected."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            sub = Subscription(self.queue_size)
+            self._subscribers.add(sub)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, kind, data):
+        with self._lock:
+            if not self._subscribers:
+                return
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            try:
+                sub.queue.put_nowait((kind, data))
+            except queue.Full:
+                sub.overflowed = True
+                self.unsubscribe(sub)
+
+    def clients(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def format_sse(kind, data):
+    """One ``text/event-stream`` message."""
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+event_bus = EventBus()
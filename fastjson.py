@@ -0,0 +1,33 @@
+"""
+Fast JSON
+=========
+استخدام orjson (إن كان مثبتاً) لقراءة JSON الطلبات بسرعة أكبر
+"""
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that decodes with orjson when it is installed.
+
+    Only ``loads`` is swapped (it backs ``request.get_json()``); responses
+    keep Flask's default encoder so output is unchanged.
+    """
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
@@ -0,0 +1,142 @@
+"""
+Async Graph API Client
+======================
+في وضع ASGI (asgi.py) تُرسل طلبات الرد إلى Graph API من حلقة asyncio
+بدلاً من حجز thread لكل طلب، فيمكن أن تكون مئات الطلبات قيد التنفيذ
+بعدد قليل من الـ threads
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:  # optional: pip install aiohttp
+    aiohttp = None
+
+from graph_client import graph
+
+# Graph calls in flight at once; delivery workers wait for a slot beyond this
+GRAPH_ASYNC_MAX_IN_FLIGHT = int(os.getenv("GRAPH_ASYNC_MAX_IN_FLIGHT", 200))
+# Threads that run reply callbacks (history, dedup, retries) after a response
+GRAPH_ASYNC_CALLBACK_WORKERS = int(os.getenv("GRAPH_ASYNC_CALLBACK_WORKERS", 8))
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGraphClient:
+    """Sends Graph POSTs on an asyncio loop on behalf of delivery threads.
+
+    ``post()`` is called from a delivery worker, returns as soon as the
+    request is handed to the loop, and ``callback(status_code, text)``
+    runs later on a callback thread, so the reply logic stays synchronous.
+    A semaphore caps requests in flight; when it is exhausted ``post()``
+    blocks the delivery worker, keeping the queue (and load shedding) as
+    the place where overload shows up. Timing, metrics and response hooks
+    go through the shared ``GraphClient``.
+    """
+
+    def __init__(self, client=graph, max_in_flight=GRAPH_ASYNC_MAX_IN_FLIGHT,
+                 callback_workers=GRAPH_ASYNC_CALLBACK_WORKERS):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.callback_workers = callback_workers
+        self.loop = None
+        self._http = None
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._callbacks = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.sent = 0
+
+    @property
+    def running(self):
+        return self.loop is not None
+
+    def start(self, loop):
+        """Attach to the server's running event loop. Returns False when aiohttp is missing."""
+        if aiohttp is None:
+            logger.warning("⚠️ aiohttp غير مثبت: طلبات Graph ستُرسل من threads الطابور (pip install aiohttp)")
+            return False
+        self._http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+                                           timeout=aiohttp.ClientTimeout(total=self.client.timeout))
+        self._callbacks = ThreadPoolExecutor(max_workers=self.callback_workers, thread_name_prefix="graph-callback")
+        self.loop = loop
+        return True
+
+    async def stop(self):
+        """Stop taking new calls, let in-flight ones finish (up to the Graph timeout), then close."""
+        self.loop = None
+        deadline = time.monotonic() + self.client.timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        if self._callbacks is not None:
+            self._callbacks.shutdown(wait=True)
+            self._callbacks = None
+
+    def post(self, path, name, data, callback):
+        """Queue a form POST; ``callback`` gets ``(status_code, text)``, or ``(None, error)`` if it raised.
+
+        Returns False without sending when the loop has stopped, so the
+        caller can fall back to a blocking request.
+        """
+        self._slots.acquire()
+        loop = self.loop
+        with self._lock:
+            self.in_flight += 1
+        try:
+            if loop is None:
+                raise RuntimeError("event loop stopped")
+            asyncio.run_coroutine_threadsafe(self._post(path, name, data, callback), loop)
+        except RuntimeError:
+            self._release()
+            return False
+        return True
+
+    async def _post(self, path, name, data, callback):
+        start = time.perf_counter()
+        try:
+            async with self._http.post(self.client.url(path), data=data) as response:
+                text = await response.text()
+        except Exception as e:
+            self.client.record(name, time.perf_counter() - start, None)
+            result = (None, str(e) or type(e).__name__)
+        else:
+            self.client.record(name, time.perf_counter() - start, response.status)
+            for hook in self.client.response_hooks:
+                hook(response)
+            result = (response.status, text)
+        finally:
+            self._release()
+        self.sent += 1
+        callbacks = self._callbacks
+        if callbacks is None:  # stopped after the drain timeout
+            self._run_callback(callback, *result)
+        else:
+            callbacks.submit(self._run_callback, callback, *result)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _run_callback(callback, status_code, text):
+        try:
+            callback(status_code, text)
+        except Exception as e:
+            logger.exception("❌ استثناء في معالجة رد Graph: %s", e)
+
+    def stats(self):
+        return {"running": self.running, "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                "sent": self.sent}
+
+
+async_graph = AsyncGraphClient()
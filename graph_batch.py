@@ -0,0 +1,179 @@
+"""
+Graph API Batch Requests
+========================
+تجميع الردود المعلقة لكل صفحة وإرسالها في طلب batch واحد
+بدلاً من طلب HTTP لكل رد
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from graph_client import graph
+
+GRAPH_BATCH_ENABLED = os.getenv("GRAPH_BATCH", "0") == "1"
+GRAPH_BATCH_WINDOW_MS = float(os.getenv("GRAPH_BATCH_WINDOW_MS", 50))
+# Facebook accepts at most 50 requests in one batch call
+GRAPH_BATCH_SIZE = min(int(os.getenv("GRAPH_BATCH_SIZE", 50)), 50)
+GRAPH_BATCH_SENDERS = int(os.getenv("GRAPH_BATCH_SENDERS", 4))
+
+logger = logging.getLogger(__name__)
+
+
+class GraphBatcher:
+    """Collects POSTs per access token and sends them as one ``batch`` call.
+
+    ``add()`` never blocks on the network: each item carries an
+    ``on_result(status_code, body_text)`` callback that is invoked from a
+    sender thread once its slice of the batch response is known.
+    """
+
+    def __init__(self, enabled=GRAPH_BATCH_ENABLED, window_ms=GRAPH_BATCH_WINDOW_MS,
+                 max_size=GRAPH_BATCH_SIZE, senders=GRAPH_BATCH_SENDERS):
+        self.enabled = enabled
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.senders = senders
+        self._cond = threading.Condition()
+        self._pending = {}  # token -> (first_added_at, [items])
+        self._thread = None
+        self._pool = None
+        self._closed = False
+        self.batches = 0
+        self.items = 0
+        self.failed_batches = 0
+
+    def _ensure_started(self):
+        if self._thread:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="graph-batch")
+        self._thread = threading.Thread(target=self._run, name="graph-batcher", daemon=True)
+        self._thread.start()
+
+    def add(self, token, name, path, body, on_result):
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._ensure_started()
+                first, items = self._pending.setdefault(token, (time.monotonic(), []))
+                items.append((name, path, body, on_result))
+                # Wake the flusher for a new bucket (it may be idle with no
+                # deadline) and for a full one
+                if len(items) == 1 or len(items) >= self.max_size:
+                    self._cond.notify()
+        if closed:
+            # Late work during shutdown is sent on its own right away
+            self._send(token, [(name, path, body, on_result)])
+
+    def _take_due(self, force=False):
+        now = time.monotonic()
+        due = []
+        for token, (first, items) in list(self._pending.items()):
+            if force or len(items) >= self.max_size or now - first >= self.window:
+                del self._pending[token]
+                # Split oversize buckets into max_size chunks
+                for i in range(0, len(items), self.max_size):
+                    due.append((token, items[i:i + self.max_size]))
+        return due
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._pending and not self._closed:
+                    self._cond.wait()
+                elif not self._closed:
+                    self._cond.wait(self.window)
+                due = self._take_due(force=self._closed)
+                closed = self._closed
+            for token, items in due:
+                try:
+                    self._pool.submit(self._send, token, items)
+                except RuntimeError:
+                    # The interpreter stops thread pools before atexit
+                    # handlers run, so the final flush is sent inline
+                    self._send(token, items)
+            if closed:
+                return
+
+    def _send(self, token, items):
+        batch = [{
+            "method": "POST",
+            "relative_url": path,
+            "body": urlencode(body),
+        } for name, path, body, on_result in items]
+        with self._cond:
+            self.batches += 1
+            self.items += len(items)
+        try:
+            response = graph.post("", name="batch", data={
+                "access_token": token,
+                "batch": json.dumps(batch),
+                "include_headers": "false",
+            })
+        except Exception as e:
+            with self._cond:
+                self.failed_batches += 1
+            for item in items:
+                self._deliver(item, None, str(e))
+            return
+
+        results = None
+        if response.status_code == 200:
+            try:
+                results = response.json()
+            except ValueError:
+                results = None
+        if not isinstance(results, list):
+            with self._cond:
+                self.failed_batches += 1
+            for item in items:
+                self._deliver(item, response.status_code, response.text)
+            return
+
+        for i, item in enumerate(items):
+            result = results[i] if i < len(results) else None
+            if result is None:
+                # Facebook returns null for items it did not get to in time
+                self._deliver(item, None, "batch item timed out")
+            else:
+                self._deliver(item, result.get("code"), result.get("body") or "")
+
+    def _deliver(self, item, status_code, text):
+        name, path, body, on_result = item
+        try:
+            on_result(status_code, text)
+        except Exception as e:
+            logger.exception("❌ استثناء في معالجة نتيجة batch (%s): %s", name, e)
+
+    def stats(self):
+        with self._cond:
+            pending = sum(len(items) for first, items in self._pending.values())
+        return {
+            "enabled": self.enabled,
+            "pending": pending,
+            "batches": self.batches,
+            "items": self.items,
+            "failed_batches": self.failed_batches,
+        }
+
+    def shutdown(self):
+        """Flush whatever is pending and wait for in-flight batches."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._pool.shutdown(wait=True)
+
+
+graph_batcher = GraphBatcher()
+atexit.register(graph_batcher.shutdown)
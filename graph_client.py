@@ -0,0 +1,114 @@
+"""
+Graph API Client
+================
+عميل مشترك لكل طلبات Graph API مع اتصالات مُعاد استخدامها (keep-alive)
+وعدادات زمن الاستجابة لكل نوع طلب
+"""
+
+import os
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Point at graph_simulator.py (e.g. http://127.0.0.1:8090/v19.0) to run offline
+GRAPH_API_URL = os.getenv("GRAPH_API_URL", "https://graph.facebook.com/v19.0")
+GRAPH_POOL_SIZE = int(os.getenv("GRAPH_POOL_SIZE", 20))
+GRAPH_TIMEOUT = float(os.getenv("GRAPH_TIMEOUT", 10))
+
+
+class GraphClient:
+    """Thin wrapper around one pooled ``requests.Session``.
+
+    ``pool_size`` is the number of keep-alive connections kept per host.
+    Every call is timed under a short ``name`` (``comment_reply``,
+    ``subscribe``...) so ``stats()`` can report per-call latency.
+    """
+
+    def __init__(self, base_url=GRAPH_API_URL, pool_size=GRAPH_POOL_SIZE, timeout=GRAPH_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        # Callables run with every response, e.g. the rate limiter's header check
+        self.response_hooks = []
+
+    @property
+    def session(self):
+        # Rebuild after fork so gunicorn workers never share sockets
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, name=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        name = name or path
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+        except Exception:
+            self.record(name, time.perf_counter() - start, None)
+            raise
+        self.record(name, time.perf_counter() - start, response.status_code)
+        for hook in self.response_hooks:
+            hook(response)
+        return response
+
+    def get(self, path, name=None, **kwargs):
+        return self.request("GET", path, name=name, **kwargs)
+
+    def post(self, path, name=None, **kwargs):
+        return self.request("POST", path, name=name, **kwargs)
+
+    def record(self, name, elapsed, status_code):
+        """Count one call in the stats and metrics; also used by graph_async for its own requests."""
+        metrics.graph_latency.observe(elapsed, call=name)
+        metrics.graph_requests.inc(call=name, code=status_code or "exception")
+        with self._lock:
+            s = self._stats.get(name)
+            if s is None:
+                s = self._stats[name] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+            ms = elapsed * 1000
+            s["calls"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+            if status_code is None or status_code >= 400:
+                s["errors"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: dict(s, avg_ms=round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0)
+                for name, s in self._stats.items()
+            }
+
+
+def error_code(text):
+    """Graph ``error.code`` from a response body, or None."""
+    try:
+        error = json.loads(text).get("error")
+    except (ValueError, AttributeError, TypeError):
+        return None
+    return error.get("code") if isinstance(error, dict) else None
+
+
+graph = GraphClient()
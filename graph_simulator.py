@@ -0,0 +1,275 @@
+"""
+Graph API Simulator
+===================
+خادم محلي يحاكي نقاط Graph API التي يستخدمها السيرفر (الردود، الرسائل،
+batch، subscribed_apps، me/accounts) لتجربة الأداء بدون إنترنت
+
+    python graph_simulator.py --port 8090 --latency-ms 80 --error-rate 0.02
+    GRAPH_API_URL=http://127.0.0.1:8090/v19.0 python server.py
+
+Latency, transient errors (500, code 2), throttling (400, code 613),
+permanent errors (400, code 100) and the reported X-App-Usage can all be
+injected. GET /_sim/stats returns call counters.
+"""
+
+import os
+import json
+import random
+import argparse
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit, urlencode
+
+# Facebook rejects batches with more than 50 requests
+MAX_BATCH = 50
+
+TRANSIENT_ERROR = (500, {"error": {"code": 2, "message": "An unexpected error has occurred. Please retry your request later."}})
+THROTTLE_ERROR = (400, {"error": {"code": 613, "message": "Calls to this api have exceeded the rate limit."}})
+PERMANENT_ERROR = (400, {"error": {"code": 100, "message": "Invalid parameter"}})
+NO_TOKEN_ERROR = (400, {"error": {"code": 190, "message": "An access token is required to request this resource."}})
+NOT_FOUND_ERROR = (400, {"error": {"code": 803, "message": "Unknown path components"}})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 drops connects when an async client opens hundreds at once
+    request_queue_size = 1024
+
+
+def _form(text):
+    return {k: v[0] for k, v in parse_qs(text, keep_blank_values=True).items()}
+
+
+class GraphSimulator:
+    """Threaded HTTP stand-in for the Graph API.
+
+    The ``*_rate`` arguments are probabilities per request (per batch
+    item for batches). ``replies`` maps each comment id / message
+    recipient to the time of its first successful reply, so load tests
+    can measure end-to-end latency.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0,
+                 permanent_rate=0.0, app_usage=0, accounts=250):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.permanent_rate = permanent_rate
+        self.app_usage = app_usage
+        self.accounts = [{
+            "id": str(200000000000000 + i),
+            "name": f"Simulated Page {i + 1}",
+            "access_token": f"sim-page-token-{i}",
+        } for i in range(accounts)]
+        self.replies = {}
+        self.calls = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._server = None
+
+    # ---- Lifecycle ----
+    def start(self, host="127.0.0.1", port=0):
+        """Serve in a background thread; returns the base URL to use as ``GRAPH_API_URL``."""
+        self._server = _Server((host, port), self._handler())
+        threading.Thread(target=self._server.serve_forever, name="graph-simulator", daemon=True).start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v19.0"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors), "replies": len(self.replies),
+                    "peak_in_flight": self.peak_in_flight}
+
+    def _handler(self):
+        sim = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # One buffered write per response; split header/body writes stall
+            # on Nagle + delayed ACK with keep-alive clients
+            wbufsize = -1
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                self._respond(*sim.handle("GET", url.path, _form(url.query), self._base()))
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                form = _form(url.query)
+                form.update(_form(self.rfile.read(length).decode()))
+                self._respond(*sim.handle("POST", url.path, form, self._base()))
+
+            def _base(self):
+                return f"http://{self.headers.get('Host', '%s:%s' % self.server.server_address[:2])}/v19.0"
+
+            def _respond(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if sim.app_usage:
+                    usage = {"call_count": sim.app_usage, "total_time": sim.app_usage, "total_cputime": sim.app_usage}
+                    self.send_header("X-App-Usage", json.dumps(usage))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # ---- Routing ----
+    def handle(self, method, path, form, base_url):
+        """Status and JSON body for one request (a batch counts as one)."""
+        parts = [p for p in path.split("/") if p]
+        if parts and parts[0].startswith("v") and parts[0][1:].replace(".", "").isdigit():
+            parts = parts[1:]
+        if parts == ["_sim", "stats"]:
+            return 200, self.stats()
+
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.latency_ms or self.jitter_ms:
+                time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+            if method == "POST" and not parts and "batch" in form:
+                return self._batch(form, base_url)
+            return self._call(method, parts, form, base_url)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _batch(self, form, base_url):
+        self._count("batch")
+        try:
+            items = json.loads(form["batch"])
+        except ValueError:
+            return self._error("batch", PERMANENT_ERROR)
+        if len(items) > MAX_BATCH:
+            return self._error("batch", PERMANENT_ERROR)
+        results = []
+        for item in items:
+            url = urlsplit(item.get("relative_url", ""))
+            item_form = {"access_token": form.get("access_token", "")}
+            item_form.update(_form(url.query))
+            item_form.update(_form(item.get("body", "")))
+            parts = [p for p in url.path.split("/") if p]
+            status, body = self._call(item.get("method", "GET").upper(), parts, item_form, base_url)
+            results.append({"code": status, "headers": [], "body": json.dumps(body)})
+        return 200, results
+
+    def _call(self, method, parts, form, base_url):
+        if parts == ["me", "accounts"] and method == "GET":
+            name = "accounts"
+        elif len(parts) == 2 and method == "POST" and parts[1] in ("comments", "messages", "subscribed_apps"):
+            name = parts[1]
+        else:
+            self._count("unknown")
+            return self._error("unknown", NOT_FOUND_ERROR)
+
+        self._count(name)
+        if not form.get("access_token"):
+            return self._error(name, NO_TOKEN_ERROR)
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return self._error(name, THROTTLE_ERROR)
+        roll -= self.throttle_rate
+        if roll < self.error_rate:
+            return self._error(name, TRANSIENT_ERROR)
+        roll -= self.error_rate
+        if roll < self.permanent_rate:
+            return self._error(name, PERMANENT_ERROR)
+
+        if name == "accounts":
+            return 200, self._accounts(form, base_url)
+        if name == "subscribed_apps":
+            return 200, {"success": True}
+        if name == "comments":
+            self._replied(parts[0])
+            return 200, {"id": f"{parts[0]}_{uuid.uuid4().hex[:12]}"}
+        try:
+            recipient = json.loads(form.get("recipient") or "{}")
+        except ValueError:
+            recipient = {}
+        key = recipient.get("comment_id") or recipient.get("id")
+        if not key:
+            return self._error(name, PERMANENT_ERROR)
+        self._replied(key)
+        return 200, {"recipient_id": recipient.get("id", key), "message_id": f"m_{uuid.uuid4().hex}"}
+
+    def _accounts(self, form, base_url):
+        limit = max(1, min(int(form.get("limit") or 25), 100))
+        start = int(form.get("after") or 0)
+        body = {"data": self.accounts[start:start + limit]}
+        paging = {"cursors": {"before": str(start), "after": str(start + limit)}}
+        if start + limit < len(self.accounts):
+            query = {k: v for k, v in form.items() if k != "after"}
+            query.update(limit=limit, after=start + limit)
+            paging["next"] = f"{base_url}/me/accounts?{urlencode(query)}"
+        body["paging"] = paging
+        return body
+
+    def _count(self, name):
+        with self.lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _error(self, name, error):
+        status, body = error
+        key = f"{name}:{body['error']['code']}"
+        with self.lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+        return status, body
+
+    def _replied(self, key):
+        with self.lock:
+            self.replies.setdefault(key, time.perf_counter())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("GRAPH_SIM_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("GRAPH_SIM_PORT", 8090)))
+    parser.add_argument("--latency-ms", type=float, default=float(os.getenv("GRAPH_SIM_LATENCY_MS", 0)))
+    parser.add_argument("--jitter-ms", type=float, default=float(os.getenv("GRAPH_SIM_JITTER_MS", 0)))
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("GRAPH_SIM_ERROR_RATE", 0)),
+                        help="share of calls failing with a transient 500 (code 2)")
+    parser.add_argument("--throttle-rate", type=float, default=float(os.getenv("GRAPH_SIM_THROTTLE_RATE", 0)),
+                        help="share of calls rejected as rate limited (code 613)")
+    parser.add_argument("--permanent-rate", type=float, default=float(os.getenv("GRAPH_SIM_PERMANENT_RATE", 0)),
+                        help="share of calls failing permanently (code 100)")
+    parser.add_argument("--app-usage", type=int, default=int(os.getenv("GRAPH_SIM_APP_USAGE", 0)),
+                        help="percentage reported in the X-App-Usage header")
+    parser.add_argument("--accounts", type=int, default=int(os.getenv("GRAPH_SIM_ACCOUNTS", 250)),
+                        help="pages returned by me/accounts")
+    args = parser.parse_args()
+
+    sim = GraphSimulator(args.latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate,
+                         args.permanent_rate, args.app_usage, args.accounts)
+    url = sim.start(args.host, args.port)
+    print(f"🧪 Graph API simulator on {url}")
+    print(f"   GRAPH_API_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        sim.stop()
+
+
+if __name__ == "__main__":
+    main()
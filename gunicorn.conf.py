@@ -0,0 +1,41 @@
+"""
+Gunicorn Config
+===============
+يُقرأ تلقائياً عند تشغيل `gunicorn server:app`
+"""
+
+import os
+import multiprocessing
+
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+# Threads per worker (gthread); every open dashboard holds one for /api/events,
+# so EVENTS_MAX_CLIENTS defaults to two fewer
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+
+# Several workers can't share in-process dedup state, so switch to the
+# shared SQLite backend unless one was chosen explicitly. Workers import
+# server.py after fork and inherit this environment.
+if workers > 1 and "STATE_BACKEND" not in os.environ:
+    os.environ["STATE_BACKEND"] = "sqlite"
+
+
+def on_starting(server):
+    backend = os.getenv("STATE_BACKEND", "local")
+    server.log.info("Workers: %s (cores: %s), state backend: %s",
+                    workers, multiprocessing.cpu_count(), backend)
+    if workers > 1 and backend == "local":
+        server.log.warning("STATE_BACKEND=local with %s workers: duplicate replies are possible", workers)
+
+
+def post_worker_init(worker):
+    import server
+    server.init_state()
+
+
+def worker_exit(server, worker):
+    from delivery import delivery_queue
+    from graph_batch import graph_batcher
+    from server import data_writer
+    delivery_queue.shutdown()
+    graph_batcher.shutdown()
+    data_writer.flush()
@@ -0,0 +1,255 @@
+"""
+History Store
+=============
+سجل العمليات كملف JSON Lines يُضاف إليه فقط (append-only)
+الكتابة O(1) لكل حدث، والضغط (compaction) يتم في الخلفية
+مع فهارس حسب الصفحة والحالة، وعدادات يومية للإحصائيات
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from datetime import date, timedelta
+
+HISTORY_FILE = "history.jsonl"
+LEGACY_HISTORY_FILE = "history.json"
+HISTORY_COUNTS_FILE = "history_counts.json"
+HISTORY_RETENTION = int(os.getenv("HISTORY_RETENTION", 1000))
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", 300))
+# Days of per-status counters kept for the dashboard stats
+HISTORY_DAILY_DAYS = int(os.getenv("HISTORY_DAILY_DAYS", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStore:
+    """Append-only history log with a bounded in-memory tail.
+
+    ``entries`` is a plain list that is only ever mutated in place, so
+    callers may keep a reference to it. It is trimmed to ``retention``
+    entries once it grows past twice that, keeping trims amortised O(1).
+    The file itself is rewritten down to ``retention`` lines by a
+    background thread every ``compact_interval`` seconds.
+
+    Every entry gets an increasing ``id`` used as the pagination cursor.
+    Per-page and per-status lists of the same entries make filtered
+    queries skip unrelated rows, and ``daily`` keeps per-day status
+    counts that outlive compaction (saved to ``counts_path``).
+    """
+
+    def __init__(self, path=HISTORY_FILE, retention=HISTORY_RETENTION,
+                 compact_interval=HISTORY_COMPACT_INTERVAL, legacy_path=LEGACY_HISTORY_FILE,
+                 counts_path=HISTORY_COUNTS_FILE, daily_days=HISTORY_DAILY_DAYS):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.counts_path = counts_path
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.daily_days = daily_days
+        self.entries = []
+        self.daily = {}  # "YYYY-MM-DD" -> {status: count}
+        self._by_page = {}
+        self._by_status = {}
+        self._last_id = 0
+        self._counted_id = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._lines = 0
+        self._compactor = None
+
+    def load(self):
+        loaded = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        loaded.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line after a crash
+                        continue
+        except FileNotFoundError:
+            loaded = self._load_legacy()
+        counts = self._load_counts()
+        with self._lock:
+            self._lines = len(loaded)
+            last_id = 0
+            for entry in loaded:
+                # Entries written before ids existed get them here
+                if not entry.get("id"):
+                    entry["id"] = last_id + 1
+                last_id = entry["id"]
+            self.daily = counts.get("days", {})
+            self._counted_id = counts.get("last_id", 0)
+            # Never reuse ids, even if the log was emptied after the counts were saved
+            self._last_id = max(last_id, self._counted_id)
+            for entry in loaded:
+                if entry["id"] > self._counted_id:
+                    self._count(entry)
+            self.entries[:] = loaded[-self.retention:]
+            self._reindex()
+        if self._lines and not os.path.exists(self.path):
+            self.compact()
+
+    def _load_legacy(self):
+        # One-time migration from the old whole-file history.json
+        try:
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _load_counts(self):
+        try:
+            with open(self.counts_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def append(self, entry):
+        with self._lock:
+            self._last_id += 1
+            entry["id"] = self._last_id
+            f = self._open()
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            self._lines += 1
+            self.entries.append(entry)
+            self._by_page.setdefault(entry.get("page"), []).append(entry)
+            self._by_status.setdefault(entry.get("status"), []).append(entry)
+            self._count(entry)
+            if len(self.entries) > 2 * self.retention:
+                del self.entries[:-self.retention]
+                self._reindex()
+        self._ensure_compactor()
+
+    def _count(self, entry):
+        day = self.daily.setdefault(entry.get("time", "")[:10], {})
+        status = entry.get("status", "")
+        day[status] = day.get(status, 0) + 1
+
+    def _reindex(self):
+        # Caller holds the lock
+        self._by_page = {}
+        self._by_status = {}
+        for entry in self.entries:
+            self._by_page.setdefault(entry.get("page"), []).append(entry)
+            self._by_status.setdefault(entry.get("status"), []).append(entry)
+
+    def query(self, before=None, limit=50, page=None, status=None, since=None, until=None):
+        """Newest-first entries with ``id < before``, optionally filtered.
+
+        ``since`` is inclusive and ``until`` exclusive; both compare against
+        the ``time`` string, so a bare date like ``2024-05-01`` works. Only
+        the retained tail is searchable.
+        """
+        with self._lock:
+            candidates = self.entries
+            if page is not None:
+                candidates = self._by_page.get(page, [])
+            if status is not None:
+                by_status = self._by_status.get(status, [])
+                if page is None or len(by_status) < len(candidates):
+                    candidates = by_status
+            end = len(candidates)
+            if before is not None:
+                end = bisect_left(candidates, before, key=_entry_id)
+            if until:
+                end = min(end, bisect_left(candidates, until, key=_entry_time))
+            start = bisect_left(candidates, since, key=_entry_time) if since else 0
+            items = []
+            for i in range(end - 1, start - 1, -1):
+                entry = candidates[i]
+                if page is not None and entry.get("page") != page:
+                    continue
+                if status is not None and entry.get("status") != status:
+                    continue
+                items.append(entry)
+                if len(items) == limit:
+                    break
+            return items
+
+    def daily_counts(self, since):
+        """``{day: {status: count}}`` for days on or after ``since``."""
+        with self._lock:
+            return {day: dict(counts) for day, counts in self.daily.items() if day >= since}
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.daily.clear()
+            self._reindex()
+            self._rewrite([])
+
+    def compact(self):
+        """Rewrite the log down to the retained tail and save the day counters."""
+        with self._lock:
+            if self._lines > self.retention or not os.path.exists(self.path):
+                self._rewrite(self.entries[-self.retention:])
+            elif self._counted_id != self._last_id:
+                self._save_counts()
+
+    def _rewrite(self, entries):
+        # Caller holds the lock
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._lines = len(entries)
+        self._save_counts()
+
+    def _save_counts(self):
+        # Caller holds the lock. Counts cover every entry up to _last_id, so
+        # load() only recounts lines appended after this point
+        oldest = (date.today() - timedelta(days=self.daily_days)).isoformat()
+        for day in [d for d in self.daily if d < oldest]:
+            del self.daily[day]
+        tmp = self.counts_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"last_id": self._last_id, "days": self.daily}, f, ensure_ascii=False)
+        os.replace(tmp, self.counts_path)
+        self._counted_id = self._last_id
+
+    def _ensure_compactor(self):
+        if self._compactor is not None or self.compact_interval <= 0:
+            return
+        with self._lock:
+            if self._compactor is not None:
+                return
+            self._compactor = threading.Thread(target=self._compact_loop, name="history-compactor", daemon=True)
+            self._compactor.start()
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.compact_interval)
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error("❌ فشل ضغط السجل: %s", e)
+
+
+def _entry_id(entry):
+    return entry["id"]
+
+
+def _entry_time(entry):
+    return entry.get("time", "")
+
+
+history_store = HistoryStore()
@@ -0,0 +1,71 @@
+"""
+Background Jobs
+===============
+تشغيل العمليات الطويلة (مثل تفعيل Webhooks لكل الصفحات) في الخلفية
+بشكل متوازٍ، مع حفظ التقدم حتى تستطيع لوحة التحكم متابعته
+"""
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 10))
+
+
+class JobRunner:
+    """Fans ``func(item)`` out over a bounded thread pool per job.
+
+    Progress is written through ``store.save_job(job)`` after every item,
+    so any worker process can answer a poll when the store is shared.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+
+    def start(self, kind, items, func):
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "running",
+            "total": len(items),
+            "completed": 0,
+            "results": [],
+            "started": time.time(),
+            "finished": None,
+        }
+        self.store.save_job(job)
+        threading.Thread(target=self._run, args=(job, items, func), name=f"job-{kind}", daemon=True).start()
+        return job
+
+    def _run(self, job, items, func):
+        lock = threading.Lock()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(items)))) as pool:
+            futures = [pool.submit(func, item) for item in items]
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"success": False, "error": str(e)[:50]}
+                with lock:
+                    job["results"].append(result)
+                    job["completed"] += 1
+                    self.store.save_job(job)
+        job["status"] = "done"
+        job["finished"] = time.time()
+        self.store.save_job(job)
+
+
+def job_progress(job, offset=0):
+    """Poll view of ``job``: counters plus the results after ``offset``."""
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "results": job["results"][offset:],
+        "next_offset": len(job["results"]),
+    }
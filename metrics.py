@@ -0,0 +1,136 @@
+"""
+Metrics
+=======
+عدادات ومدرجات تكرارية (histograms) بصيغة Prometheus لنقطة /metrics
+بدون أي مكتبة خارجية
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                value = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    value[i] += 1
+            value[-2] += seconds
+            value[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, value in self._values.items():
+                for bound, count in zip(self.buckets, value):
+                    lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {value[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.label_names, key)} {value[-1]}")
+        return lines
+
+
+class Gauge:
+    """Value read from ``func()`` at scrape time; ``func`` may return a
+    number or a dict of label value -> number."""
+
+    def __init__(self, name, help, func, label=None):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.label = label
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.func()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for label_value, v in value.items():
+                lines.append(f"{self.name}{_labels((self.label,), (label_value,))} {v}")
+        else:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============ Reply pipeline metrics ============
+webhook_requests = Counter("webhook_requests_total", "POST /webhook requests by response status", ["status"])
+webhook_events = Counter("webhook_events_total", "Webhook events enqueued by kind", ["kind"])
+replies = Counter("replies_total", "Final reply outcomes by action, page and outcome", ["action", "page", "outcome"])
+reply_latency = Histogram("reply_latency_seconds", "Time from first send attempt to final outcome", ["action", "page"])
+graph_requests = Counter("graph_requests_total", "Graph API responses by call and HTTP code", ["call", "code"])
+graph_errors = Counter("graph_errors_total", "Graph API error codes by call", ["call", "error_code"])
+graph_latency = Histogram("graph_request_seconds", "Graph API round-trip time by call", ["call"])
+dedup_hits = Counter("dedup_hits_total", "Comments skipped because they were already processed")
+reply_budget_skips = Counter("reply_budget_skipped_total", "Comments left unanswered because a reply budget was used up",
+                             ["budget", "page"])
+persistence_latency = Histogram("persistence_write_seconds", "Time spent writing state by store", ["store"],
+                                buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
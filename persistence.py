@@ -0,0 +1,126 @@
+"""
+Persistence
+===========
+حفظ data.json بشكل ذري (ملف مؤقت + fsync + rename) مع تجميع التعديلات
+المتتالية في كتابة واحدة بدلاً من إعادة كتابة الملف بعد كل تعديل
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+
+import metrics
+
+# Mutations within this many milliseconds are written together
+DATA_SAVE_DELAY_MS = float(os.getenv("DATA_SAVE_DELAY_MS", 200))
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path, obj):
+    """Replace ``path`` with ``obj`` as JSON; readers see the old or new file, never half of one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:  # directories can't be opened on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class DebouncedWriter:
+    """Writes ``snapshot()`` to ``path`` at most once per ``delay_ms``.
+
+    ``mark_dirty()`` is cheap and returns immediately; a background thread
+    serializes the current state once the window closes, so N mutations
+    in a burst cost one write. ``flush()`` writes synchronously and runs
+    at shutdown. ``on_written`` is called after every successful write.
+    With ``delay_ms`` 0 every ``mark_dirty()`` writes before returning.
+
+    ``snapshot()`` runs on the writer thread while requests may still be
+    mutating, so it should copy the containers it returns; a mutation
+    that lands mid-write marks the writer dirty again and is written next.
+    """
+
+    def __init__(self, path, snapshot, name="data", delay_ms=DATA_SAVE_DELAY_MS, on_written=None):
+        self.path = path
+        self.name = name
+        self.snapshot = snapshot
+        self.delay = delay_ms / 1000
+        self.on_written = on_written
+        self.writes = 0
+        self.coalesced = 0
+        self._dirty = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @property
+    def pending(self):
+        return self._dirty
+
+    def mark_dirty(self):
+        with self._cond:
+            if self._dirty:
+                self.coalesced += 1
+                if self.delay > 0:
+                    return
+            self._dirty = True
+            if self.delay > 0:
+                self._ensure_started()
+                self._cond.notify()
+                return
+        # Write-through: return only once the change is on disk (or in the
+        # write already running, which snapshots after clearing the flag)
+        self.flush()
+
+    def _ensure_started(self):
+        # Caller holds the lock. Threads don't survive fork, so start per process
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="data-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+            time.sleep(self.delay)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("❌ فشل حفظ %s: %s", self.path, e)
+                time.sleep(1)
+
+    def flush(self):
+        """Write now if anything changed since the last write."""
+        with self._write_lock:
+            with self._cond:
+                if not self._dirty:
+                    return
+                self._dirty = False
+            try:
+                with metrics.persistence_latency.time(store=self.name):
+                    atomic_write_json(self.path, self.snapshot())
+            except Exception:
+                with self._cond:
+                    self._dirty = True
+                raise
+            self.writes += 1
+        if self.on_written:
+            self.on_written()
+
+    def stats(self):
+        return {"writes": self.writes, "coalesced": self.coalesced, "pending": self._dirty}
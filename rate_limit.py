@@ -0,0 +1,189 @@
+"""
+Rate Limiter
+============
+حدود معدل (token buckets) لكل صفحة وللتطبيق كله قبل أي طلب Graph API
+تتكيف تلقائياً مع هيدرات X-Business-Use-Case-Usage و X-App-Usage
+"""
+
+import os
+import json
+import threading
+import time
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_PAGE_PER_SEC = float(os.getenv("RATE_LIMIT_PAGE_PER_SEC", 5))
+RATE_LIMIT_PAGE_BURST = float(os.getenv("RATE_LIMIT_PAGE_BURST", 10))
+RATE_LIMIT_APP_PER_SEC = float(os.getenv("RATE_LIMIT_APP_PER_SEC", 50))
+RATE_LIMIT_APP_BURST = float(os.getenv("RATE_LIMIT_APP_BURST", 100))
+# Start slowing down once Facebook reports this much usage (percent)
+RATE_LIMIT_HIGH_USAGE = float(os.getenv("RATE_LIMIT_HIGH_USAGE", 75))
+# Pause applied after a throttling error when Facebook gives no estimate
+RATE_LIMIT_THROTTLE_PAUSE = float(os.getenv("RATE_LIMIT_THROTTLE_PAUSE", 60))
+# Server processes (gunicorn/uvicorn WEB_CONCURRENCY). Buckets live in each
+# process, so every one enforces an equal share of the limits above
+RATE_LIMIT_WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+
+# Graph API error codes that mean "slow down"
+THROTTLE_CODES = {4, 17, 32, 613, 80001, 80006}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now):
+        # Nothing accrues while paused, so a pause isn't followed by a full burst
+        start = max(self.updated, min(self.paused_until, now))
+        self.tokens = min(self.capacity, self.tokens + (now - start) * self.rate)
+        self.updated = now
+
+    def book(self, now):
+        """Take a token, going into debt when none is left. Returns seconds until the booked slot."""
+        self.tokens -= 1
+        debt = max(0.0, -self.tokens)
+        return max(0.0, self.paused_until - now) + debt / (self.rate if self.rate > 0 else 1.0)
+
+    def pause(self, seconds, now):
+        self.refill(now)
+        self.paused_until = max(self.paused_until, now + seconds)
+        # Resume at the steady rate rather than with a burst Facebook just refused
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimiter:
+    """Per-page and app-wide token buckets shared by all delivery threads.
+
+    ``reserve()`` never blocks: it books the next free slot in both
+    buckets (tokens may go negative) and returns how far off it is. The
+    caller defers the job once, for exactly that long, and then sends
+    without asking again, so waiting replies keep their order and a
+    throttled page waits off the delivery workers. Rates and bursts are
+    divided by ``workers`` so N processes together stay within the limits.
+    """
+
+    def __init__(self, enabled=RATE_LIMIT_ENABLED, page_rate=RATE_LIMIT_PAGE_PER_SEC,
+                 page_burst=RATE_LIMIT_PAGE_BURST, app_rate=RATE_LIMIT_APP_PER_SEC,
+                 app_burst=RATE_LIMIT_APP_BURST, high_usage=RATE_LIMIT_HIGH_USAGE,
+                 throttle_pause=RATE_LIMIT_THROTTLE_PAUSE, workers=RATE_LIMIT_WORKERS):
+        self.enabled = enabled
+        self.workers = workers
+        self.page_rate = page_rate / workers
+        self.page_burst = max(1.0, page_burst / workers)
+        self.high_usage = high_usage
+        self.throttle_pause = throttle_pause
+        self.app = TokenBucket(app_rate / workers, max(1.0, app_burst / workers))
+        self.pages = {}
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.throttled = 0
+
+    def _page(self, page_id):
+        bucket = self.pages.get(page_id)
+        if bucket is None:
+            bucket = self.pages[page_id] = TokenBucket(self.page_rate, self.page_burst)
+        return bucket
+
+    def reserve(self, page_id):
+        """Book a call for ``page_id``. Returns 0 to send now, else the seconds until the booked slot."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            page = self._page(page_id)
+            page.refill(now)
+            self.app.refill(now)
+            wait = max(page.book(now), self.app.book(now))
+            if wait:
+                self.waits += 1
+                self.wait_seconds += wait
+            return wait
+
+    def penalize(self, page_id, seconds=None):
+        """Pause ``page_id`` after Facebook answered with a throttling error."""
+        with self._lock:
+            self.throttled += 1
+            self._page(page_id).pause(seconds or self.throttle_pause, time.monotonic())
+
+    def observe_headers(self, headers):
+        """Adapt bucket rates to the usage Facebook reports on every response."""
+        if not self.enabled:
+            return
+        app_usage = _parse_header(headers.get("X-App-Usage"))
+        buc_usage = _parse_header(headers.get("X-Business-Use-Case-Usage"))
+        if not app_usage and not buc_usage:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if isinstance(app_usage, dict):
+                self._adapt(self.app, _usage_percent(app_usage), 0, now)
+            if isinstance(buc_usage, dict):
+                for page_id, entries in buc_usage.items():
+                    for usage in entries or []:
+                        regain = usage.get("estimated_time_to_regain_access") or 0
+                        self._adapt(self._page(page_id), _usage_percent(usage), regain * 60, now)
+
+    def _adapt(self, bucket, percent, pause_seconds, now):
+        if pause_seconds:
+            bucket.pause(pause_seconds, now)
+        if percent >= 95:
+            factor = 0.1
+        elif percent >= self.high_usage:
+            factor = 0.5
+        else:
+            factor = 1.0
+        bucket.refill(now)
+        bucket.rate = bucket.base_rate * factor
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "waits": self.waits,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "throttled": self.throttled,
+                "app": _bucket_stats(self.app, now),
+                "pages": {page_id: _bucket_stats(b, now) for page_id, b in self.pages.items()},
+            }
+
+
+def _parse_header(value):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def _usage_percent(usage):
+    return max(usage.get("call_count", 0) or 0, usage.get("total_cputime", 0) or 0,
+               usage.get("total_time", 0) or 0)
+
+
+def _bucket_stats(bucket, now):
+    return {
+        "rate": bucket.rate,
+        "tokens": round(bucket.tokens, 2),
+        "paused_for": round(max(0.0, bucket.paused_until - now), 1),
+    }
+
+
+def throttle_code(text):
+    """Return the Graph error code if ``text`` is a throttling error, else None."""
+    try:
+        error = json.loads(text).get("error", {})
+    except (ValueError, AttributeError):
+        return None
+    code = error.get("code") if isinstance(error, dict) else None
+    return code if code in THROTTLE_CODES else None
+
+
+rate_limiter = RateLimiter()
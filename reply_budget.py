@@ -0,0 +1,120 @@
+"""
+Reply Budget
+============
+حد لعدد الردود لكل منشور ولكل صفحة خلال نافذة زمنية متحركة، حتى لا
+يستهلك منشور منتشر (آلاف التعليقات) حدود Facebook ويملأ التعليقات بالردود.
+الردود على الردود تحصل على جزء فقط من الحد، ليبقى الباقي للتعليقات المباشرة
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+# Sliding window length in seconds
+REPLY_BUDGET_WINDOW = float(os.getenv("REPLY_BUDGET_WINDOW", 3600))
+# Comments answered per post / per page within the window; 0 means unlimited
+REPLY_BUDGET_POST = int(os.getenv("REPLY_BUDGET_POST", 200))
+REPLY_BUDGET_PAGE = int(os.getenv("REPLY_BUDGET_PAGE", 2000))
+# Share of each budget that replies-to-comments may use
+REPLY_BUDGET_CHAIN_SHARE = float(os.getenv("REPLY_BUDGET_CHAIN_SHARE", 0.5))
+
+
+class ReplyBudget:
+    """Sliding-window reply counters keyed by post and by page.
+
+    ``admit()`` records a reply and returns None when both windows have
+    room, otherwise the name of the exhausted budget ("post" or "page").
+    A reply chain is held to ``chain_share`` of each limit, so a busy
+    thread stops getting answers before direct comments do.
+
+    The windows live in this process; with several workers the sqlite
+    state backend keeps them in the shared database instead and uses this
+    object for its limits and counters.
+    """
+
+    def __init__(self, window=REPLY_BUDGET_WINDOW, post_limit=REPLY_BUDGET_POST,
+                 page_limit=REPLY_BUDGET_PAGE, chain_share=REPLY_BUDGET_CHAIN_SHARE):
+        self.window = window
+        self.post_limit = post_limit
+        self.page_limit = page_limit
+        self.chain_share = chain_share
+        self.posts = {}
+        self.pages = {}
+        self.admitted = 0
+        self.skipped = {"post": 0, "page": 0}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def checks(self, page_id, post_id, top_level):
+        """``(budget, key, limit)`` for each window that applies to this reply."""
+        checks = (("post", post_id, self.post_limit), ("page", page_id, self.page_limit))
+        return [(name, key, limit if top_level else int(limit * self.chain_share))
+                for name, key, limit in checks if limit > 0 and key is not None]
+
+    def count(self, exhausted):
+        """Count an ``admit()`` outcome made elsewhere (the shared state backend)."""
+        with self._lock:
+            if exhausted:
+                self.skipped[exhausted] += 1
+            else:
+                self.admitted += 1
+
+    def config(self):
+        with self._lock:
+            return {
+                "window": self.window,
+                "post_limit": self.post_limit,
+                "page_limit": self.page_limit,
+                "chain_share": self.chain_share,
+                "admitted": self.admitted,
+                "skipped": dict(self.skipped),
+            }
+
+    def _count(self, windows, key, now):
+        times = windows.get(key)
+        if times is None:
+            return 0
+        cutoff = now - self.window
+        while times and times[0] <= cutoff:
+            times.popleft()
+        return len(times)
+
+    def admit(self, page_id, post_id, top_level=True):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            checks = self.checks(page_id, post_id, top_level)
+            windows = {"post": self.posts, "page": self.pages}
+            for name, key, limit in checks:
+                if self._count(windows[name], key, now) >= limit:
+                    self.skipped[name] += 1
+                    return name
+            for name, key, limit in checks:
+                windows[name].setdefault(key, deque()).append(now)
+            self.admitted += 1
+            return None
+
+    def _sweep(self, now):
+        # Drop posts and pages with nothing left in the window, so memory
+        # tracks recent activity rather than every post ever seen
+        for windows in (self.posts, self.pages):
+            for key in [k for k in windows if self._count(windows, k, now) == 0]:
+                del windows[key]
+        self._next_sweep = now + max(1.0, self.window / 10)
+
+    def stats(self):
+        now = time.monotonic()
+        stats = self.config()
+        with self._lock:
+            busiest = sorted(((self._count(self.posts, k, now), k) for k in list(self.posts)), reverse=True)[:10]
+            stats.update({
+                "tracked_posts": len(self.posts),
+                "busiest_posts": [{"post_id": k, "replies": n} for n, k in busiest],
+                "pages": {k: self._count(self.pages, k, now) for k in list(self.pages)},
+            })
+            return stats
+
+
+reply_budget = ReplyBudget()
@@ -0,0 +1,112 @@
+"""
+Retry Engine
+============
+إعادة محاولة الطلبات الفاشلة مؤقتاً (5xx، انتهاء المهلة، التقييد)
+مع تأخير أُسّي عشوائي (jittered exponential backoff)
+"""
+
+import os
+import json
+import heapq
+import itertools
+from collections import Counter
+import random
+import threading
+import time
+
+from rate_limit import THROTTLE_CODES
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 2))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 300))
+
+# Graph error codes that are worth retrying besides throttling
+TRANSIENT_CODES = {1, 2}
+
+
+def classify(status_code, text):
+    """Return "ok", "transient" or "permanent" for a Graph API outcome."""
+    if status_code == 200:
+        return "ok"
+    if status_code is None or status_code >= 500 or status_code == 429:
+        # Exceptions (timeouts, connection resets) and server errors
+        return "transient"
+    try:
+        error = json.loads(text).get("error", {})
+    except (ValueError, AttributeError):
+        return "permanent"
+    if not isinstance(error, dict):
+        return "permanent"
+    if error.get("is_transient") or error.get("code") in THROTTLE_CODES | TRANSIENT_CODES:
+        return "transient"
+    return "permanent"
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff for the given 0-based attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryScheduler:
+    """Runs ``submit(func, *args, key=key)`` once each scheduled delay has elapsed.
+
+    One timer thread and a heap of due times; the actual work is handed to
+    ``submit`` (the delivery queue) so retries share its workers and limits,
+    and ``key`` sends them back to the same delivery shard. ``shard_of(key)``
+    lets ``pending(shard)`` count the retries headed for one shard.
+    """
+
+    def __init__(self, submit, shard_of=None):
+        self.submit = submit
+        self.shard_of = shard_of or (lambda key: 0)
+        self._per_shard = Counter()
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.scheduled = 0
+
+    def schedule(self, delay, func, *args, key=None):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="retry-scheduler", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._counter), func, args, key))
+            self._per_shard[self.shard_of(key)] += 1
+            self.scheduled += 1
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, func, args, key = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+            if self.submit(func, *args, key=key):
+                with self._cond:
+                    self._per_shard[self.shard_of(key)] -= 1
+            else:
+                # Delivery queue full: try again shortly rather than lose it
+                with self._cond:
+                    heapq.heappush(self._heap, (time.monotonic() + 1, next(self._counter), func, args, key))
+
+    def drain(self):
+        """Remove and return every job still waiting, as ``(func, args)``."""
+        with self._cond:
+            jobs = [(func, args) for due, _, func, args, key in sorted(self._heap)]
+            self._heap.clear()
+            self._per_shard.clear()
+            return jobs
+
+    def pending(self, shard=None):
+        if shard is None:
+            return len(self._heap)
+        return self._per_shard[shard]
+
+    def stats(self):
+        return {"pending": self.pending(), "scheduled": self.scheduled}
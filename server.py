@@ -5,25 +5,58 @@ Facebook Webhooks Server with Web Dashboard
 مع واجهة ويب لإدارة الصفحات والقوالب
 """
 
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for, session
-import requests
+from flask import Flask, Response, request, jsonify, redirect, url_for, session, stream_with_context
 import os
 import json
+import logging
 import random
-import re
-from datetime import datetime
+import uuid
+import atexit
+import time
+from collections import Counter
+from datetime import datetime, timedelta
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
 
-app = Flask(__name__)
+from app_logging import setup_logging, log_payload
+from fastjson import FastJSONProvider
+from delivery import delivery_queue, PRIORITY_NORMAL, PRIORITY_LOW
+from graph_client import graph, error_code
+from graph_batch import graph_batcher
+from graph_async import async_graph
+from rate_limit import rate_limiter, throttle_code
+from retry import RetryScheduler, classify, backoff_delay, RETRY_MAX_ATTEMPTS
+from spintax import compile_template, render
+from jobs import JobRunner, job_progress
+import metrics
+from history_store import HISTORY_DAILY_DAYS
+from state_backend import create_backend
+from static_assets import StaticAssets
+from events import event_bus, format_sse
+from persistence import DebouncedWriter, DATA_SAVE_DELAY_MS
+from capture import webhook_capture
+from fastjson import loads as json_loads
+import admission
+
+setup_logging()
+logger = logging.getLogger("webhooks")
+
+# /static is served by StaticAssets (precompressed, ETag) instead of Flask's default handler
+app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app)
+static_assets = StaticAssets()
+app.jinja_env.globals["asset_url"] = static_assets.url
+graph.response_hooks.append(lambda response: rate_limiter.observe_headers(response.headers))
 app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-change-this")
 
 # ============ الإعدادات ============
 VERIFY_TOKEN = os.getenv("VERIFY_TOKEN", "my_fb_webhook_verify_2024")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "0452218374")
+# Optional bearer token for /metrics; leave empty to let Prometheus scrape freely
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
 
 # البيانات (ستُحفظ في ملفات JSON)
 DATA_FILE = "data.json"
-HISTORY_FILE = "history.json"
 
 data = {
     "pages": [],  # [{"id": "...", "name": "...", "token": "..."}]
@@ -35,60 +68,109 @@ data = {
         "send_private_reply": True
     }
 }
-history = []
-processed_comments = set()
+# Dedup index, history and dead letters; shared between gunicorn workers when STATE_BACKEND=sqlite
+state = create_backend()
+retry_scheduler = RetryScheduler(delivery_queue.submit, delivery_queue.index)
+job_runner = JobRunner(state)
+metrics.Gauge("delivery_queue_depth", "Jobs waiting on the delivery queue", delivery_queue.depth)
+metrics.Gauge("delivery_shard_depth", "Jobs waiting per delivery shard (DELIVERY_SHARDS)", delivery_queue.shard_depths,
+              label="shard")
+metrics.Gauge("delivery_in_flight", "Jobs currently running on delivery workers", lambda: delivery_queue.stats()["in_flight"])
+metrics.Gauge("delivery_rejected", "Jobs rejected because the delivery queue was full", lambda: delivery_queue.rejected)
+metrics.Gauge("retry_pending", "Replies waiting for a retry", retry_scheduler.pending)
+metrics.Gauge("graph_batch_pending", "Replies waiting to be sent in a Graph batch", lambda: graph_batcher.stats()["pending"])
+metrics.Gauge("rate_limit_wait_seconds", "Total time replies were deferred waiting for rate limit tokens",
+              lambda: rate_limiter.wait_seconds)
+metrics.Gauge("dead_letters", "Replies in the dead letter queue", lambda: state.count_dead_letters())
+metrics.Gauge("events_clients", "Dashboards connected to /api/events (EVENTS_MAX_CLIENTS)", event_bus.clients)
+
+# page id -> page dict, kept in sync with data["pages"]
+page_index = {}
+# Spintax trees compiled once, index-aligned with the template lists in data
+compiled_templates = {"comment_templates": [], "message_templates": []}
+_data_mtime = None
+_state_initialized = False
+# With a shared backend other workers reload data.json on their next request,
+# so a change must be on disk before the request that made it returns
+data_writer = DebouncedWriter(DATA_FILE, lambda: snapshot_data(), on_written=lambda: _remember_data_mtime(),
+                              delay_ms=0 if state.shared else DATA_SAVE_DELAY_MS)
+atexit.register(data_writer.flush)
+metrics.Gauge("data_writes_coalesced", "data.json saves merged into an earlier write (DATA_SAVE_DELAY_MS)",
+              lambda: data_writer.stats()["coalesced"])
 
 # ============ تحميل وحفظ البيانات ============
+def snapshot_data():
+    # Shallow copies are taken under the GIL, so a request mutating a list
+    # mid-write can't break the writer's json.dump
+    return {key: value.copy() if isinstance(value, (list, dict)) else value for key, value in data.items()}
+
 def load_data():
-    global data, history, processed_comments
+    global data
     try:
         with open(DATA_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
+        _remember_data_mtime()
     except:
         save_data()
-    
-    try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            history = json.load(f)
-            processed_comments = set(h.get("comment_id", "") for h in history)
-    except:
-        history = []
+    rebuild_page_index()
+    compile_templates()
+    publish_data()
 
 def save_data():
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """Write data.json: coalesced over DATA_SAVE_DELAY_MS in one process, immediately when state is shared"""
+    data_writer.mark_dirty()
+    publish_data()
 
-def save_history():
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        # Keep last 1000 entries
-        json.dump(history[-1000:], f, ensure_ascii=False, indent=2)
+def publish_data():
+    """Push pages (without tokens), templates and settings to open dashboards"""
+    event_bus.publish("data", {
+        "pages": [{"id": p.get("id"), "name": p.get("name", "Unknown")} for p in data.get("pages", [])],
+        "comment_templates": data.get("comment_templates", []),
+        "message_templates": data.get("message_templates", []),
+        "settings": data.get("settings", {}),
+    })
 
-PROCESSED_FILE = "processed.json"
+def _remember_data_mtime():
+    global _data_mtime
+    try:
+        _data_mtime = os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        _data_mtime = None
 
-def load_processed():
-    global processed_comments
+def reload_data_if_changed():
+    """Pick up data.json changes written by another worker process"""
+    if data_writer.pending:
+        # Our own unsaved changes win; they are written within the save delay
+        return
     try:
-        with open(PROCESSED_FILE, "r", encoding="utf-8") as f:
-            processed_comments = set(json.load(f))
-    except:
-        processed_comments = set()
+        mtime = os.stat(DATA_FILE).st_mtime_ns
+    except OSError:
+        return
+    if mtime != _data_mtime:
+        load_data()
 
-def save_processed():
-    with open(PROCESSED_FILE, "w", encoding="utf-8") as f:
-        # Keep last 500 only to prevent file from growing too large
-        comments_list = list(processed_comments)[-500:]
-        json.dump(comments_list, f)
+def init_state():
+    """Load config, dedup index and history. Runs once per process:
+    from __main__, the gunicorn post_worker_init hook or the ASGI lifespan."""
+    global _state_initialized
+    if _state_initialized:
+        return
+    _state_initialized = True
+    load_data()
+    state.load()
 
 def add_history(page_name, action, status, details=""):
-    history.append({
+    entry = {
         "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "page": page_name,
         "action": action,
         "status": status,
         "details": details,
         "comment_id": details if "comment" in action.lower() else ""
-    })
-    save_history()
+    }
+    with metrics.persistence_latency.time(store="history"):
+        state.append_history(entry)
+    event_bus.publish("history", entry)
 
 # ============ المصادقة ============
 def login_required(f):
@@ -100,32 +182,172 @@ def login_required(f):
     return decorated_function
 
 # ============ Spintax ============
-def process_spintax(text):
-    pattern = r'\{([^{}]+)\}'
-    def replace(match):
-        options = match.group(1).split('|')
-        return random.choice(options)
-    while re.search(pattern, text):
-        text = re.sub(pattern, replace, text, count=1)
-    return text
+def compile_templates():
+    for kind in compiled_templates:
+        compiled_templates[kind] = [compile_template(t) for t in data.get(kind, [])]
+
+def pick_template(kind):
+    """Render a random compiled template of ``kind``, or None if there are none"""
+    compiled = compiled_templates[kind]
+    if not compiled:
+        return None
+    return render(random.choice(compiled))
 
 # ============ الرد على التعليقات ============
-def get_page_token(page_id):
+def rebuild_page_index():
+    global page_index
+    index = {}
     for page in data.get("pages", []):
-        if page["id"] == page_id:
-            return page.get("token"), page.get("name", "Unknown")
-    return None, None
+        # First entry wins, as with the old linear scan
+        index.setdefault(page.get("id"), page)
+    page_index = index
 
-def reply_to_comment(comment_id, page_id, user_name):
-    # Check if already processed FIRST to prevent duplicates
-    if comment_id in processed_comments:
-        print(f"⏭️ تعليق معالج مسبقاً: {comment_id}")
+def get_page_token(page_id):
+    page = page_index.get(page_id)
+    if page is None:
+        return None, None
+    return page.get("token"), page.get("name", "Unknown")
+
+def post_to_graph(page_id, token, name, path, body, on_result, attempt=0, started=None, reserved=False):
+    """POST form ``body`` to the Graph API and hand the outcome to ``on_result``.
+
+    ``on_result(status_code, text)`` gets ``status_code=None`` when the
+    request raised. The call books a page and app rate limit slot; if the
+    slot is later it is rescheduled once for then (``reserved``), so it
+    never blocks a delivery worker.
+    With batching enabled it is queued on the batcher and ``on_result``
+    runs later from a sender thread; under asgi.py the request is sent
+    from the event loop and ``on_result`` runs on a callback thread. Transient failures are retried with
+    backoff; ``on_result`` only sees the final outcome, and permanent
+    failures also land in the dead letter queue.
+    """
+    if started is None:
+        started = time.monotonic()
+    
+    def handle(status_code, text):
+        outcome = classify(status_code, text)
+        if outcome != "ok":
+            metrics.graph_errors.inc(call=name, error_code=error_code(text) or status_code or "exception")
+        if outcome == "transient" and attempt + 1 < RETRY_MAX_ATTEMPTS:
+            if throttle_code(text):
+                rate_limiter.penalize(page_id)
+            delay = backoff_delay(attempt)
+            logger.info("🔁 إعادة محاولة %s بعد %.1f ثانية (محاولة %d/%d)", name, delay, attempt + 2, RETRY_MAX_ATTEMPTS,
+                        extra={"page_id": page_id, "status_code": status_code})
+            retry_scheduler.schedule(delay, post_to_graph, page_id, token, name, path, body, on_result,
+                                     attempt + 1, started, key=page_id)
+            return False
+        if outcome != "ok":
+            add_dead_letter(page_id, name, path, body, status_code, text, attempt + 1)
+        metrics.replies.inc(action=name, page=page_id, outcome="success" if outcome == "ok" else "failure")
+        metrics.reply_latency.observe(time.monotonic() - started, action=name, page=page_id)
+        return on_result(status_code, text)
+
+    if not reserved:
+        wait = rate_limiter.reserve(page_id)
+        if wait:
+            retry_scheduler.schedule(wait, post_to_graph, page_id, token, name, path, body, on_result,
+                                     attempt, started, True, key=page_id)
+            return True
+    if graph_batcher.enabled:
+        graph_batcher.add(token, name, path, body, handle)
+        return True
+    data = dict(body, access_token=token)
+    if async_graph.running and async_graph.post(path, name, data, handle):
+        # ASGI mode: the request runs on the event loop and handle() on a callback thread
+        return True
+    try:
+        response = graph.post(path, name=name, data=data)
+    except Exception as e:
+        return handle(None, str(e))
+    return handle(response.status_code, response.text)
+
+# ============ Dead letters ============
+REPLY_ACTIONS = {
+    "comment_reply": "رد على تعليق",
+    "private_reply": "رسالة خاصة",
+    "message_reply": "رد على رسالة",
+}
+
+def add_dead_letter(page_id, name, path, body, status_code, error, attempts):
+    # The token is not stored; replay looks it up again from the page list
+    state.add_dead_letter({
+        "id": uuid.uuid4().hex,
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "page_id": page_id,
+        "name": name,
+        "path": path,
+        "body": body,
+        "status_code": status_code,
+        "error": (error or "")[:300],
+        "attempts": attempts
+    })
+
+def replay_dead_letter(letter):
+    """Send a dead letter again through the normal retry path"""
+    page_id = letter["page_id"]
+    token, page_name = get_page_token(page_id)
+    action = REPLY_ACTIONS.get(letter["name"], letter["name"])
+    if not token:
+        add_history("Unknown", action, "فشل", f"لا يوجد توكن للصفحة {page_id}")
         return False
     
-    # Add to processed IMMEDIATELY to prevent duplicates from webhook retries
-    processed_comments.add(comment_id)
-    save_processed()  # Save to file immediately
+    def on_result(status_code, text):
+        if status_code == 200:
+            add_history(page_name, action, "نجاح", "إعادة إرسال")
+            return True
+        add_history(page_name, action, "فشل", (text or "")[:100])
+        return False
+    
+    return post_to_graph(page_id, token, letter["name"], letter["path"], letter["body"], on_result)
+
+def park_pending_retries():
+    # Retries still waiting at shutdown would be lost; keep them as dead letters
+    for func, args in retry_scheduler.drain():
+        page_id, token, name, path, body, on_result, attempt = args[:7]
+        add_dead_letter(page_id, name, path, body, None, "shutdown before retry", attempt)
+
+atexit.register(park_pending_retries)
+
+def process_comment(comment_id, page_id, user_name, top_level, post_id=None):
+    """Delivery job for one new comment: public reply, then private reply"""
+    # Check and mark processed in one step, BEFORE replying, so webhook
+    # retries and concurrent workers can't reply twice
+    with metrics.persistence_latency.time(store="dedup"):
+        claimed = state.claim(comment_id)
+    if not claimed:
+        metrics.dedup_hits.inc()
+        logger.debug("⏭️ تعليق معالج مسبقاً: %s", comment_id)
+        return
+    
+    # Claimed either way, so a redelivery after the window doesn't reply late.
+    # Only comments that will actually get a reply use up the budget
+    if will_reply_to_comment(page_id, top_level):
+        exhausted = state.admit_reply(page_id, post_id, top_level)
+        if exhausted:
+            metrics.reply_budget_skips.inc(budget=exhausted, page=page_id)
+            logger.debug("⏭️ تخطي: تم استهلاك حد الردود (%s) للمنشور %s", exhausted, post_id)
+            return
     
+    reply_to_comment(comment_id, page_id, user_name)
+    
+    # Only send private reply for top-level comments (not replies to replies)
+    if top_level:
+        send_private_reply(comment_id, page_id, user_name)
+    else:
+        logger.debug("⏭️ تخطي رسالة خاصة: تعليق على تعليق (ليس تعليق أساسي)")
+
+def will_reply_to_comment(page_id, top_level):
+    """True when reply_to_comment or send_private_reply would send something"""
+    token, _ = get_page_token(page_id)
+    if not token:
+        return False
+    settings = data["settings"]
+    if settings.get("auto_reply_comments", True) and compiled_templates["comment_templates"]:
+        return True
+    return top_level and settings.get("send_private_reply", True) and bool(compiled_templates["message_templates"])
+
+def reply_to_comment(comment_id, page_id, user_name):
     if not data["settings"].get("auto_reply_comments", True):
         return False
     
@@ -134,32 +356,27 @@ def reply_to_comment(comment_id, page_id, user_name):
         add_history("Unknown", "خطأ", "فشل", f"لا يوجد توكن للصفحة {page_id}")
         return False
     
-    templates = data.get("comment_templates", [])
-    if not templates:
+    reply_text = pick_template("comment_templates")
+    if reply_text is None:
         return False
     
-    template = random.choice(templates)
-    reply_text = process_spintax(template)
-    
-    url = f"https://graph.facebook.com/v19.0/{comment_id}/comments"
-    try:
-        response = requests.post(url, data={
-            "message": reply_text,
-            "access_token": token
-        }, timeout=10)
-        
-        if response.status_code == 200:
+    def on_result(status_code, text):
+        if status_code == 200:
             add_history(page_name, "رد على تعليق", "نجاح", f"الرد على {user_name}: {reply_text[:50]}...")
             return True
+        elif status_code is None:
+            logger.error("❌ استثناء: %s", text, extra={"page_id": page_id, "comment_id": comment_id})
+            add_history(page_name, "رد على تعليق", "خطأ", text[:100])
+            return False
         else:
-            error_text = response.text[:100]
-            print(f"❌ فشل الرد: {error_text}")
+            error_text = text[:100]
+            logger.warning("❌ فشل الرد: %s", error_text, extra={"page_id": page_id, "comment_id": comment_id})
             add_history(page_name, "رد على تعليق", "فشل", error_text)
             return False
-    except Exception as e:
-        print(f"❌ استثناء: {e}")
-        add_history(page_name, "رد على تعليق", "خطأ", str(e)[:100])
-        return False
+    
+    return post_to_graph(page_id, token, "comment_reply", f"{comment_id}/comments", {
+        "message": reply_text
+    }, on_result)
 
 def send_private_reply(comment_id, page_id, user_name):
     if not data["settings"].get("send_private_reply", True):
@@ -167,41 +384,47 @@ def send_private_reply(comment_id, page_id, user_name):
     
     token, page_name = get_page_token(page_id)
     if not token:
-        print(f"⚠️ رسالة خاصة: لا يوجد توكن للصفحة {page_id}")
+        logger.warning("⚠️ رسالة خاصة: لا يوجد توكن للصفحة %s", page_id)
         return False
     
-    templates = data.get("message_templates", [])
-    if not templates:
-        print("⚠️ رسالة خاصة: لا يوجد قوالب رسائل")
+    message_text = pick_template("message_templates")
+    if message_text is None:
+        logger.warning("⚠️ رسالة خاصة: لا يوجد قوالب رسائل")
         return False
     
-    template = random.choice(templates)
-    message_text = process_spintax(template)
-    
-    # Use the correct API: POST to /{page_id}/messages with recipient.comment_id
-    url = f"https://graph.facebook.com/v19.0/{page_id}/messages"
-    try:
-        payload = {
-            'recipient': json.dumps({'comment_id': comment_id}),
-            'message': json.dumps({'text': message_text}),
-            'access_token': token
-        }
-        
-        print(f"📨 إرسال رسالة خاصة لـ {user_name}...")
-        response = requests.post(url, data=payload, timeout=10)
-        
-        if response.status_code == 200:
+    def on_result(status_code, text):
+        if status_code == 200:
             add_history(page_name, "رسالة خاصة", "نجاح", f"رسالة لـ {user_name}")
-            print(f"✅ تم إرسال رسالة خاصة لـ {user_name}")
+            logger.debug("✅ تم إرسال رسالة خاصة لـ %s", user_name)
             return True
+        elif status_code is None:
+            logger.error("❌ استثناء رسالة خاصة: %s", text, extra={"page_id": page_id, "comment_id": comment_id})
+            return False
         else:
-            error_text = response.text[:150]
-            print(f"❌ فشل الرسالة الخاصة: {error_text}")
+            error_text = text[:150]
+            logger.warning("❌ فشل الرسالة الخاصة: %s", error_text, extra={"page_id": page_id, "comment_id": comment_id})
             add_history(page_name, "رسالة خاصة", "فشل", error_text[:80])
             return False
-    except Exception as e:
-        print(f"❌ استثناء رسالة خاصة: {e}")
-        return False
+    
+    # Use the correct API: POST to /{page_id}/messages with recipient.comment_id
+    payload = {
+        'recipient': json.dumps({'comment_id': comment_id}),
+        'message': json.dumps({'text': message_text})
+    }
+    logger.debug("📨 إرسال رسالة خاصة لـ %s...", user_name)
+    return post_to_graph(page_id, token, "private_reply", f"{page_id}/messages", payload, on_result)
+
+def process_message(mid, sender_id, page_id):
+    """Delivery job for one incoming message, claimed by its mid like comments"""
+    # A redelivered webhook (e.g. after a 503) carries the same mid
+    if mid:
+        with metrics.persistence_latency.time(store="dedup"):
+            claimed = state.claim(mid)
+        if not claimed:
+            metrics.dedup_hits.inc()
+            logger.debug("⏭️ رسالة معالجة مسبقاً: %s", mid)
+            return
+    reply_to_message(sender_id, page_id)
 
 def reply_to_message(sender_id, page_id):
     if not data["settings"].get("auto_reply_messages", True):
@@ -211,30 +434,26 @@ def reply_to_message(sender_id, page_id):
     if not token:
         return False
     
-    templates = data.get("message_templates", [])
-    if not templates:
+    message_text = pick_template("message_templates")
+    if message_text is None:
         return False
     
-    template = random.choice(templates)
-    message_text = process_spintax(template)
-    
-    url = f"https://graph.facebook.com/v19.0/{page_id}/messages"
-    try:
-        response = requests.post(url, json={
-            "recipient": {"id": sender_id},
-            "message": {"text": message_text},
-            "access_token": token
-        }, timeout=10)
-        
-        if response.status_code == 200:
+    def on_result(status_code, text):
+        if status_code == 200:
             add_history(page_name, "رد على رسالة", "نجاح", "")
             return True
+        elif status_code is None:
+            add_history(page_name, "رد على رسالة", "خطأ", text[:100])
+            return False
         else:
-            add_history(page_name, "رد على رسالة", "فشل", response.text[:100])
+            add_history(page_name, "رد على رسالة", "فشل", text[:100])
             return False
-    except Exception as e:
-        add_history(page_name, "رد على رسالة", "خطأ", str(e)[:100])
-        return False
+    
+    # Form-encoded like the private reply so it can share batching and rate limits
+    return post_to_graph(page_id, token, "message_reply", f"{page_id}/messages", {
+        "recipient": json.dumps({"id": sender_id}),
+        "message": json.dumps({"text": message_text})
+    }, on_result)
 
 # ============ HTML Templates ============
 DASHBOARD_HTML = '''
@@ -245,156 +464,7 @@ DASHBOARD_HTML = '''
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>لوحة تحكم Webhooks</title>
     <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap" rel="stylesheet">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Cairo', sans-serif;
-            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 50%, #0f3460 100%);
-            min-height: 100vh;
-            color: #fff;
-        }
-        .container { max-width: 1400px; margin: 0 auto; padding: 20px; }
-        
-        /* Header */
-        .header {
-            background: rgba(0,0,0,0.3);
-            padding: 20px;
-            border-radius: 15px;
-            margin-bottom: 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        .header h1 { color: #00e5ff; font-size: 1.8em; }
-        .header .status {
-            background: #00c853;
-            padding: 8px 20px;
-            border-radius: 20px;
-            font-weight: bold;
-        }
-        .logout-btn {
-            background: #ff5252;
-            color: white;
-            border: none;
-            padding: 10px 20px;
-            border-radius: 8px;
-            cursor: pointer;
-            text-decoration: none;
-        }
-        
-        /* Stats */
-        .stats {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 15px;
-            margin-bottom: 20px;
-        }
-        .stat-card {
-            background: rgba(255,255,255,0.1);
-            padding: 20px;
-            border-radius: 12px;
-            text-align: center;
-        }
-        .stat-card h3 { font-size: 2em; color: #00e5ff; }
-        .stat-card p { color: #aaa; }
-        
-        /* Grid */
-        .grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(400px, 1fr));
-            gap: 20px;
-        }
-        
-        /* Cards */
-        .card {
-            background: rgba(255,255,255,0.05);
-            border-radius: 15px;
-            padding: 20px;
-            border: 1px solid rgba(255,255,255,0.1);
-        }
-        .card-header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 15px;
-            padding-bottom: 10px;
-            border-bottom: 1px solid rgba(255,255,255,0.1);
-        }
-        .card-title { color: #00e5ff; font-size: 1.2em; }
-        
-        /* Forms */
-        input, textarea, select {
-            width: 100%;
-            padding: 12px;
-            border: 1px solid rgba(255,255,255,0.2);
-            border-radius: 8px;
-            background: rgba(0,0,0,0.3);
-            color: #fff;
-            margin-bottom: 10px;
-            font-family: inherit;
-        }
-        textarea { min-height: 100px; resize: vertical; }
-        
-        .btn {
-            padding: 10px 20px;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            font-weight: bold;
-            transition: all 0.3s;
-        }
-        .btn-primary { background: linear-gradient(45deg, #00e5ff, #00b8d4); color: #000; }
-        .btn-danger { background: #ff5252; color: #fff; }
-        .btn-success { background: #00c853; color: #fff; }
-        .btn:hover { transform: translateY(-2px); opacity: 0.9; }
-        
-        /* List */
-        .list-item {
-            background: rgba(0,0,0,0.2);
-            padding: 12px;
-            border-radius: 8px;
-            margin-bottom: 8px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }
-        .list-item:hover { background: rgba(0,0,0,0.3); }
-        
-        /* Table */
-        table { width: 100%; border-collapse: collapse; }
-        th, td { padding: 12px; text-align: right; border-bottom: 1px solid rgba(255,255,255,0.1); }
-        th { color: #00e5ff; }
-        .status-success { color: #00c853; }
-        .status-error { color: #ff5252; }
-        
-        /* Toggle */
-        .toggle-container { display: flex; align-items: center; gap: 10px; margin: 10px 0; }
-        .toggle {
-            width: 50px; height: 26px;
-            background: #555;
-            border-radius: 13px;
-            position: relative;
-            cursor: pointer;
-            transition: 0.3s;
-        }
-        .toggle.active { background: #00c853; }
-        .toggle::after {
-            content: '';
-            position: absolute;
-            width: 22px; height: 22px;
-            background: #fff;
-            border-radius: 50%;
-            top: 2px; left: 2px;
-            transition: 0.3s;
-        }
-        .toggle.active::after { left: 26px; }
-        
-        /* Responsive */
-        @media (max-width: 768px) {
-            .grid { grid-template-columns: 1fr; }
-            .header { flex-direction: column; gap: 15px; }
-        }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('dashboard.css') }}">
 </head>
 <body>
     <div class="container">
@@ -452,7 +522,7 @@ DASHBOARD_HTML = '''
                 </div>
                 
                 <!-- Current Pages List -->
-                <p style="color: #aaa; margin-bottom: 10px;">الصفحات المضافة ({{ pages|length }}):</p>
+                <p style="color: #aaa; margin-bottom: 10px;">الصفحات المضافة (<span id="pages-list-count">{{ pages|length }}</span>):</p>
                 <div id="pages-list" style="max-height: 300px; overflow-y: auto;">
                     {% for page in pages %}
                     <div class="list-item">
@@ -463,16 +533,14 @@ DASHBOARD_HTML = '''
                 </div>
                 
                 <!-- Subscribe All Button -->
-                {% if pages %}
-                <div style="margin-top: 15px; padding: 15px; background: rgba(0,150,0,0.2); border-radius: 10px;">
-                    <button class="btn btn-success" onclick="subscribeAllPages()" style="width: 100%;">
+                <div id="subscribe-box" style="margin-top: 15px; padding: 15px; background: rgba(0,150,0,0.2); border-radius: 10px;{{ '' if pages else ' display: none;' }}">
+                    <button class="btn btn-success" onclick="subscribeAllPages()" id="subscribe-btn" style="width: 100%;">
                         🔔 تفعيل Webhooks لكل الصفحات
                     </button>
                     <p style="color: #aaa; font-size: 0.85em; margin-top: 8px; text-align: center;">
                         اضغط هنا بعد إضافة الصفحات لتفعيل الإشعارات
                     </p>
                 </div>
-                {% endif %}
             </div>
             
             <!-- Comment Templates -->
@@ -519,17 +587,17 @@ DASHBOARD_HTML = '''
                     <span class="card-title">⚙️ الإعدادات</span>
                 </div>
                 <div class="toggle-container">
-                    <div class="toggle {{ 'active' if settings.auto_reply_comments else '' }}" 
+                    <div class="toggle {{ 'active' if settings.auto_reply_comments else '' }}" data-setting="auto_reply_comments"
                          onclick="toggleSetting('auto_reply_comments', this)"></div>
                     <span>الرد على التعليقات تلقائياً</span>
                 </div>
                 <div class="toggle-container">
-                    <div class="toggle {{ 'active' if settings.auto_reply_messages else '' }}" 
+                    <div class="toggle {{ 'active' if settings.auto_reply_messages else '' }}" data-setting="auto_reply_messages"
                          onclick="toggleSetting('auto_reply_messages', this)"></div>
                     <span>الرد على الرسائل تلقائياً</span>
                 </div>
                 <div class="toggle-container">
-                    <div class="toggle {{ 'active' if settings.send_private_reply else '' }}" 
+                    <div class="toggle {{ 'active' if settings.send_private_reply else '' }}" data-setting="send_private_reply"
                          onclick="toggleSetting('send_private_reply', this)"></div>
                     <span>إرسال رسالة خاصة مع الرد</span>
                 </div>
@@ -540,13 +608,37 @@ DASHBOARD_HTML = '''
                 </div>
             </div>
             
+            <!-- Dead Letters -->
+            <div class="card">
+                <div class="card-header">
+                    <span class="card-title">📮 الردود الفاشلة (<span id="dead-letters-count">{{ dead_letters_count }}</span>)</span>
+                </div>
+                <p style="color: #aaa; margin-bottom: 15px;">ردود فشلت نهائياً بعد كل المحاولات ويمكن إعادة إرسالها</p>
+                <button class="btn btn-success" onclick="replayDeadLetters()">🔁 إعادة إرسال الكل</button>
+                <button class="btn btn-danger" onclick="deleteDeadLetters()">🗑️ حذف الكل</button>
+            </div>
+            
             <!-- History -->
             <div class="card" style="grid-column: span 2;">
                 <div class="card-header">
                     <span class="card-title">📜 سجل الردود</span>
                     <button class="btn btn-danger" onclick="clearHistory()">🗑️ مسح السجل</button>
                 </div>
-                <div style="max-height: 400px; overflow-y: auto;">
+                <div style="display: flex; gap: 10px;">
+                    <select id="history-page" onchange="loadHistory(true)">
+                        <option value="">كل الصفحات</option>
+                        {% for page in pages %}
+                        <option value="{{ page.name }}">{{ page.name }}</option>
+                        {% endfor %}
+                    </select>
+                    <select id="history-status" onchange="loadHistory(true)">
+                        <option value="">كل الحالات</option>
+                        <option value="نجاح">نجاح</option>
+                        <option value="فشل">فشل</option>
+                        <option value="خطأ">خطأ</option>
+                    </select>
+                </div>
+                <div id="history-scroll" style="max-height: 400px; overflow-y: auto;">
                     <table>
                         <thead>
                             <tr>
@@ -556,210 +648,14 @@ DASHBOARD_HTML = '''
                                 <th>الحالة</th>
                             </tr>
                         </thead>
-                        <tbody id="history-table">
-                            {% for item in history[-50:]|reverse %}
-                            <tr>
-                                <td>{{ item.time }}</td>
-                                <td>{{ item.page }}</td>
-                                <td>{{ item.action }}</td>
-                                <td class="{{ 'status-success' if item.status == 'نجاح' else 'status-error' }}">
-                                    {{ item.status }}
-                                </td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
+                        <tbody id="history-table"></tbody>
                     </table>
+                    <button class="btn" id="history-more" onclick="loadHistory(false)" style="display: none; width: 100%; margin-top: 10px;">⬇️ المزيد</button>
                 </div>
         </div>
     </div>
     
-    <script>
-        // Global variable to store fetched pages
-        let fetchedPages = [];
-        
-        // Fetch Pages from Token
-        async function fetchPages() {
-            const token = document.getElementById('user-token').value;
-            if (!token) {
-                alert('يرجى إدخال Access Token');
-                return;
-            }
-            
-            const btn = document.getElementById('fetch-btn');
-            btn.textContent = '⏳ جاري الجلب...';
-            btn.disabled = true;
-            
-            try {
-                const response = await fetch('/api/fetch-pages', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({token: token})
-                });
-                const result = await response.json();
-                
-                if (result.success) {
-                    fetchedPages = result.pages;
-                    displayFetchedPages(result.pages);
-                } else {
-                    alert('خطأ: ' + (result.error || 'فشل جلب الصفحات'));
-                }
-            } catch (e) {
-                alert('خطأ في الاتصال');
-            }
-            
-            btn.textContent = '📥 جلب الصفحات';
-            btn.disabled = false;
-        }
-        
-        // Display fetched pages with checkboxes
-        function displayFetchedPages(pages) {
-            const container = document.getElementById('fetched-pages-container');
-            const list = document.getElementById('fetched-pages-list');
-            
-            if (pages.length === 0) {
-                list.innerHTML = '<p style="color: #aaa;">لم يتم العثور على صفحات</p>';
-            } else {
-                list.innerHTML = pages.map((p, i) => `
-                    <div class="list-item">
-                        <label style="cursor: pointer; flex: 1;">
-                            <input type="checkbox" class="page-checkbox" data-index="${i}" checked>
-                            ${p.name}
-                        </label>
-                    </div>
-                `).join('');
-            }
-            
-            container.style.display = 'block';
-        }
-        
-        // Toggle all checkboxes
-        function toggleAllFetched() {
-            const checked = document.getElementById('select-all-fetched').checked;
-            document.querySelectorAll('.page-checkbox').forEach(cb => cb.checked = checked);
-        }
-        
-        // Add selected pages
-        async function addSelectedPages() {
-            const selected = [];
-            document.querySelectorAll('.page-checkbox:checked').forEach(cb => {
-                const index = parseInt(cb.dataset.index);
-                selected.push(fetchedPages[index]);
-            });
-            
-            if (selected.length === 0) {
-                alert('يرجى تحديد صفحة واحدة على الأقل');
-                return;
-            }
-            
-            const response = await fetch('/api/pages/bulk', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({pages: selected})
-            });
-            const result = await response.json();
-            
-            alert(`تمت إضافة ${result.added} صفحة جديدة`);
-            location.reload();
-        }
-        
-        // Subscribe all pages to webhooks
-        async function subscribeAllPages() {
-            if (!confirm('هل تريد تفعيل Webhooks لكل الصفحات المضافة؟')) {
-                return;
-            }
-            
-            try {
-                const response = await fetch('/api/pages/subscribe-all', {method: 'POST'});
-                const result = await response.json();
-                
-                if (result.success) {
-                    let message = `تم تفعيل ${result.subscribed} من ${result.total} صفحة\n\n`;
-                    result.results.forEach(r => {
-                        message += r.success ? `✅ ${r.page}\n` : `❌ ${r.page}: ${r.error}\n`;
-                    });
-                    alert(message);
-                    location.reload();
-                } else {
-                    alert('حدث خطأ أثناء التفعيل');
-                }
-            } catch (e) {
-                alert('خطأ في الاتصال');
-            }
-        }
-        
-        // Delete Page
-        async function deletePage(id) {
-            if (confirm('هل أنت متأكد من حذف هذه الصفحة؟')) {
-                await fetch('/api/pages/' + id, {method: 'DELETE'});
-                location.reload();
-            }
-        }
-        
-        // Delete All Pages
-        async function deleteAllPages() {
-            if (confirm('هل أنت متأكد من حذف جميع الصفحات؟')) {
-                const pages = {{ pages | tojson }};
-                for (const p of pages) {
-                    await fetch('/api/pages/' + p.id, {method: 'DELETE'});
-                }
-                location.reload();
-            }
-        }
-        
-        // Add Comment Template
-        document.getElementById('add-comment-template-form').onsubmit = async (e) => {
-            e.preventDefault();
-            await fetch('/api/templates/comment', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({template: document.getElementById('comment-template').value})
-            });
-            location.reload();
-        };
-        
-        // Add Message Template
-        document.getElementById('add-message-template-form').onsubmit = async (e) => {
-            e.preventDefault();
-            await fetch('/api/templates/message', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({template: document.getElementById('message-template').value})
-            });
-            location.reload();
-        };
-        
-        // Delete Templates
-        async function deleteCommentTemplate(index) {
-            await fetch('/api/templates/comment/' + index, {method: 'DELETE'});
-            location.reload();
-        }
-        
-        async function deleteMessageTemplate(index) {
-            await fetch('/api/templates/message/' + index, {method: 'DELETE'});
-            location.reload();
-        }
-        
-        // Toggle Setting
-        async function toggleSetting(setting, el) {
-            el.classList.toggle('active');
-            await fetch('/api/settings', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({setting: setting, value: el.classList.contains('active')})
-            });
-        }
-        
-        // Clear History
-        async function clearHistory() {
-            if (confirm('هل أنت متأكد من مسح السجل؟')) {
-                await fetch('/api/history', {method: 'DELETE'});
-                location.reload();
-            }
-        }
-        
-        // Auto-refresh disabled to prevent losing data while working
-        // setTimeout(() => location.reload(), 30000);
-    </script>
+    <script src="{{ asset_url('dashboard.js') }}"></script>
 </body>
 </html>
 '''
@@ -772,52 +668,7 @@ LOGIN_HTML = '''
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>تسجيل الدخول</title>
     <link href="https://fonts.googleapis.com/css2?family=Cairo:wght@400;600;700&display=swap" rel="stylesheet">
-    <style>
-        * { margin: 0; padding: 0; box-sizing: border-box; }
-        body {
-            font-family: 'Cairo', sans-serif;
-            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 50%, #0f3460 100%);
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            color: #fff;
-        }
-        .login-box {
-            background: rgba(255,255,255,0.05);
-            padding: 40px;
-            border-radius: 20px;
-            border: 1px solid rgba(255,255,255,0.1);
-            width: 100%;
-            max-width: 400px;
-            text-align: center;
-        }
-        h1 { color: #00e5ff; margin-bottom: 30px; font-size: 1.8em; }
-        input {
-            width: 100%;
-            padding: 15px;
-            border: 1px solid rgba(255,255,255,0.2);
-            border-radius: 10px;
-            background: rgba(0,0,0,0.3);
-            color: #fff;
-            margin-bottom: 15px;
-            font-size: 1em;
-        }
-        button {
-            width: 100%;
-            padding: 15px;
-            background: linear-gradient(45deg, #00e5ff, #00b8d4);
-            border: none;
-            border-radius: 10px;
-            color: #000;
-            font-weight: bold;
-            font-size: 1.1em;
-            cursor: pointer;
-            transition: 0.3s;
-        }
-        button:hover { transform: translateY(-2px); }
-        .error { color: #ff5252; margin-bottom: 15px; }
-    </style>
+    <link rel="stylesheet" href="{{ asset_url('login.css') }}">
 </head>
 <body>
     <div class="login-box">
@@ -834,22 +685,53 @@ LOGIN_HTML = '''
 </html>
 '''
 
+# Compiled once here instead of on every render_template_string call
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(DASHBOARD_HTML)
+LOGIN_TEMPLATE = app.jinja_env.from_string(LOGIN_HTML)
+
+def render_page(template, **context):
+    """Render a compiled template as a revalidated HTML response.
+
+    The body's hash is the ETag, so an unchanged dashboard reload costs a
+    304 instead of the full page.
+    """
+    app.update_template_context(context)
+    response = Response(template.render(context), mimetype="text/html")
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.add_etag()
+    return response.make_conditional(request)
+
 # ============ Routes ============
+@app.before_request
+def sync_shared_state():
+    # Another worker may have changed pages/templates/settings
+    if state.shared:
+        reload_data_if_changed()
+
+def dashboard_counters():
+    today = datetime.now().strftime("%Y-%m-%d")
+    return {
+        "pages": len(data.get("pages", [])),
+        "replies_today": state.daily_counts(today).get(today, {}).get("نجاح", 0),
+        "templates": len(data.get("comment_templates", [])) + len(data.get("message_templates", [])),
+        "dead_letters": state.count_dead_letters(),
+    }
+
 @app.route("/")
 @login_required
 def dashboard():
-    today = datetime.now().strftime("%Y-%m-%d")
-    replies_today = len([h for h in history if h.get("time", "").startswith(today) and h.get("status") == "نجاح"])
+    counters = dashboard_counters()
     
-    return render_template_string(DASHBOARD_HTML,
+    # History rows are fetched by the page from /api/history, later changes arrive on /api/events
+    return render_page(DASHBOARD_TEMPLATE,
         pages=data.get("pages", []),
         comment_templates=data.get("comment_templates", []),
         message_templates=data.get("message_templates", []),
         settings=data.get("settings", {}),
-        history=history,
-        pages_count=len(data.get("pages", [])),
-        replies_count=replies_today,
-        templates_count=len(data.get("comment_templates", [])) + len(data.get("message_templates", [])),
+        pages_count=counters["pages"],
+        replies_count=counters["replies_today"],
+        templates_count=counters["templates"],
+        dead_letters_count=counters["dead_letters"],
         webhook_url=request.host_url + "webhook"
     )
 
@@ -862,7 +744,11 @@ def login():
             return redirect(url_for("dashboard"))
         else:
             error = "كلمة المرور غير صحيحة"
-    return render_template_string(LOGIN_HTML, error=error)
+    return render_page(LOGIN_TEMPLATE, error=error)
+
+@app.route("/static/<name>")
+def static_asset(name):
+    return static_assets.response(name, request, Response)
 
 @app.route("/logout")
 def logout():
@@ -875,110 +761,174 @@ def logout():
 def add_page():
     page_data = request.json
     data.setdefault("pages", []).append(page_data)
+    page_index.setdefault(page_data.get("id"), page_data)
     save_data()
     return jsonify({"success": True})
 
+# Safety cap on me/accounts cursor pages (100 pages each)
+FETCH_PAGES_MAX_REQUESTS = int(os.getenv("FETCH_PAGES_MAX_REQUESTS", 100))
+
+class FetchPagesTruncated(Exception):
+    """me/accounts still had more pages after FETCH_PAGES_MAX_REQUESTS requests"""
+
+def format_account_pages(body):
+    return [{"id": p["id"], "name": p["name"], "token": p["access_token"]} for p in body.get("data", [])]
+
+def iter_account_pages(first_body):
+    """Yield formatted page lists from me/accounts, following ``paging.next``.
+
+    The request for the next cursor page is started before the current one
+    is yielded, so the Graph round-trip overlaps with streaming it out.
+    Raises FetchPagesTruncated if pages remain after the request cap.
+    """
+    def fetch(url):
+        response = graph.get(url, name="fetch_pages", timeout=15)
+        if response.status_code != 200:
+            raise RuntimeError(response.text[:200])
+        return response.json()
+    
+    body = first_body
+    with ThreadPoolExecutor(max_workers=1) as prefetch:
+        # The first request was made by the caller
+        for requests_made in range(1, FETCH_PAGES_MAX_REQUESTS + 1):
+            next_url = body.get("paging", {}).get("next")
+            more = next_url and requests_made < FETCH_PAGES_MAX_REQUESTS
+            pending = prefetch.submit(fetch, next_url) if more else None
+            yield format_account_pages(body)
+            if pending is None:
+                if next_url:
+                    raise FetchPagesTruncated()
+                return
+            body = pending.result()
+
 @app.route("/api/fetch-pages", methods=["POST"])
 @login_required
 def fetch_pages():
-    """Fetch all pages from a user access token"""
+    """Fetch all pages from a user access token, streamed as NDJSON chunks"""
     user_token = request.json.get("token")
     if not user_token:
         return jsonify({"success": False, "error": "Token required"}), 400
     
     try:
-        # Get all pages for this user
-        url = f"https://graph.facebook.com/v19.0/me/accounts?fields=id,name,access_token&limit=100&access_token={user_token}"
-        response = requests.get(url, timeout=15)
+        # First page synchronously so a bad token still gets a plain error response
+        response = graph.get("me/accounts", name="fetch_pages", params={
+            "fields": "id,name,access_token",
+            "limit": 100,
+            "access_token": user_token
+        }, timeout=15)
         
         if response.status_code != 200:
             return jsonify({"success": False, "error": response.text}), 400
         
-        pages_data = response.json().get("data", [])
-        
-        # Format pages
-        pages = []
-        for p in pages_data:
-            pages.append({
-                "id": p["id"],
-                "name": p["name"],
-                "token": p["access_token"]
-            })
-        
-        return jsonify({"success": True, "pages": pages})
+        first_body = response.json()
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
+    
+    def generate():
+        total = 0
+        try:
+            for pages in iter_account_pages(first_body):
+                total += len(pages)
+                yield json.dumps({"type": "pages", "pages": pages}, ensure_ascii=False) + "\n"
+        except FetchPagesTruncated:
+            # Tell the dashboard the list is incomplete rather than ending with "done"
+            yield json.dumps({"type": "truncated", "total": total, "max_requests": FETCH_PAGES_MAX_REQUESTS}) + "\n"
+            return
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e), "total": total}, ensure_ascii=False) + "\n"
+            return
+        yield json.dumps({"type": "done", "total": total}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 @app.route("/api/pages/bulk", methods=["POST"])
 @login_required
 def add_pages_bulk():
     """Add multiple pages at once"""
     pages_to_add = request.json.get("pages", [])
-    existing_ids = {p["id"] for p in data.get("pages", [])}
     
     added = 0
     for page in pages_to_add:
-        if page["id"] not in existing_ids:
+        if page["id"] not in page_index:
             data.setdefault("pages", []).append(page)
+            page_index[page["id"]] = page
             added += 1
     
-    save_data()
+    if added:
+        save_data()
     return jsonify({"success": True, "added": added})
 
+def subscribe_page(page):
+    page_id = page.get("id")
+    page_token = page.get("token")
+    page_name = page.get("name", "Unknown")
+    
+    if not page_id or not page_token:
+        return {"page": page_name, "success": False, "error": "Missing ID or token"}
+    
+    try:
+        response = graph.post(f"{page_id}/subscribed_apps", name="subscribe", data={
+            "subscribed_fields": "feed,messages",
+            "access_token": page_token
+        })
+        
+        if response.status_code == 200:
+            add_history(page_name, "اشتراك Webhook", "نجاح", "")
+            return {"page": page_name, "success": True}
+        else:
+            error_msg = response.json().get("error", {}).get("message", "Unknown error")
+            add_history(page_name, "اشتراك Webhook", "فشل", error_msg[:50])
+            return {"page": page_name, "success": False, "error": error_msg[:50]}
+    except Exception as e:
+        return {"page": page_name, "success": False, "error": str(e)[:50]}
+
 @app.route("/api/pages/subscribe-all", methods=["POST"])
 @login_required
 def subscribe_all_pages():
-    """Subscribe all pages to webhooks at once"""
-    results = []
-    pages = data.get("pages", [])
-    
-    for page in pages:
-        page_id = page.get("id")
-        page_token = page.get("token")
-        page_name = page.get("name", "Unknown")
-        
-        if not page_id or not page_token:
-            results.append({"page": page_name, "success": False, "error": "Missing ID or token"})
-            continue
-        
-        try:
-            url = f"https://graph.facebook.com/v19.0/{page_id}/subscribed_apps"
-            response = requests.post(url, data={
-                "subscribed_fields": "feed,messages",
-                "access_token": page_token
-            }, timeout=10)
-            
-            if response.status_code == 200:
-                results.append({"page": page_name, "success": True})
-                add_history(page_name, "اشتراك Webhook", "نجاح", "")
-            else:
-                error_msg = response.json().get("error", {}).get("message", "Unknown error")
-                results.append({"page": page_name, "success": False, "error": error_msg[:50]})
-                add_history(page_name, "اشتراك Webhook", "فشل", error_msg[:50])
-        except Exception as e:
-            results.append({"page": page_name, "success": False, "error": str(e)[:50]})
-    
-    success_count = len([r for r in results if r["success"]])
-    return jsonify({
-        "success": True,
-        "total": len(pages),
-        "subscribed": success_count,
-        "results": results
-    })
+    """Start subscribing all pages to webhooks concurrently; poll /api/jobs/<id>"""
+    pages = list(data.get("pages", []))
+    job = job_runner.start("subscribe", pages, subscribe_page)
+    return jsonify({"success": True, "job_id": job["id"], "total": job["total"]}), 202
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@login_required
+def get_job(job_id):
+    """Background job progress; pass ?offset=n to get only results after n"""
+    job = state.get_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    offset = request.args.get("offset", 0, type=int)
+    return jsonify(dict(job_progress(job, offset), success=True))
 
 @app.route("/api/pages/<page_id>", methods=["DELETE"])
 @login_required
 def delete_page(page_id):
-    data["pages"] = [p for p in data.get("pages", []) if p["id"] != page_id]
-    save_data()
+    if page_index.pop(page_id, None) is not None:
+        data["pages"] = [p for p in data.get("pages", []) if p["id"] != page_id]
+        save_data()
     return jsonify({"success": True})
 
+@app.route("/api/pages/bulk", methods=["DELETE"])
+@login_required
+def delete_pages_bulk():
+    """Delete the pages in ``{"ids": [...]}``, or all pages without ids, in one save"""
+    body = request.get_json(silent=True) or {}
+    ids = body.get("ids")
+    if ids is None:
+        ids = list(page_index)
+    removed = {page_id for page_id in ids if page_index.pop(page_id, None) is not None}
+    if removed:
+        data["pages"] = [p for p in data.get("pages", []) if p["id"] not in removed]
+        save_data()
+    return jsonify({"success": True, "deleted": len(removed)})
+
 @app.route("/api/templates/comment", methods=["POST"])
 @login_required
 def add_comment_template():
     template = request.json.get("template")
     if template:
         data.setdefault("comment_templates", []).append(template)
+        compiled_templates["comment_templates"].append(compile_template(template))
         save_data()
     return jsonify({"success": True})
 
@@ -987,6 +937,7 @@ def add_comment_template():
 def delete_comment_template(index):
     if 0 <= index < len(data.get("comment_templates", [])):
         data["comment_templates"].pop(index)
+        compiled_templates["comment_templates"].pop(index)
         save_data()
     return jsonify({"success": True})
 
@@ -996,6 +947,7 @@ def add_message_template():
     template = request.json.get("template")
     if template:
         data.setdefault("message_templates", []).append(template)
+        compiled_templates["message_templates"].append(compile_template(template))
         save_data()
     return jsonify({"success": True})
 
@@ -1004,6 +956,7 @@ def add_message_template():
 def delete_message_template(index):
     if 0 <= index < len(data.get("message_templates", [])):
         data["message_templates"].pop(index)
+        compiled_templates["message_templates"].pop(index)
         save_data()
     return jsonify({"success": True})
 
@@ -1016,12 +969,183 @@ def update_setting():
     save_data()
     return jsonify({"success": True})
 
+@app.route("/api/delivery/stats", methods=["GET"])
+@login_required
+def delivery_stats():
+    """Background delivery queue depth and backpressure counters"""
+    return jsonify(dict(delivery_queue.stats(), retries=retry_scheduler.stats()))
+
+@app.route("/api/graph/stats", methods=["GET"])
+@login_required
+def graph_stats():
+    """Per-call Graph API latency counters and batching stats"""
+    return jsonify({"calls": graph.stats(), "batch": graph_batcher.stats(), "async": async_graph.stats()})
+
+@app.route("/api/rate-limit/stats", methods=["GET"])
+@login_required
+def rate_limit_stats():
+    """Token bucket state per page and for the whole app"""
+    return jsonify(rate_limiter.stats())
+
+@app.route("/api/reply-budget/stats", methods=["GET"])
+@login_required
+def reply_budget_stats():
+    """Replies per page and busiest posts in the current budget window"""
+    return jsonify(state.reply_budget_stats())
+
+@app.route("/api/capture/stats", methods=["GET"])
+@login_required
+def capture_stats():
+    """Webhook capture journal state (WEBHOOK_CAPTURE)"""
+    return jsonify(webhook_capture.stats())
+
+@app.route("/api/dead-letters", methods=["GET"])
+@login_required
+def list_dead_letters():
+    """Permanently failed replies, newest last"""
+    limit = request.args.get("limit", 200, type=int)
+    return jsonify({
+        "count": state.count_dead_letters(),
+        "retries_pending": retry_scheduler.pending(),
+        "items": state.list_dead_letters(limit)
+    })
+
+@app.route("/api/dead-letters/replay", methods=["POST"])
+@login_required
+def replay_dead_letters():
+    """Replay the given dead letters (all of them when no ids are sent)"""
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    letters = state.take_dead_letters(ids)
+    queued = 0
+    for letter in letters:
+        if delivery_queue.submit(replay_dead_letter, letter, key=letter["page_id"]):
+            queued += 1
+        else:
+            state.add_dead_letter(letter)
+    return jsonify({"success": True, "queued": queued, "total": len(letters)})
+
+@app.route("/api/dead-letters", methods=["DELETE"])
+@login_required
+def delete_dead_letters():
+    """Discard the given dead letters (all of them when no ids are sent)"""
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    removed = state.take_dead_letters(ids)
+    return jsonify({"success": True, "removed": len(removed)})
+
+# Seconds between counter refreshes (and cross-worker polls) on /api/events
+EVENTS_TICK = float(os.getenv("EVENTS_TICK", 2))
+# Streams are closed after this long; EventSource reconnects on its own
+EVENTS_MAX_AGE = float(os.getenv("EVENTS_MAX_AGE", 600))
+# Keep-alive comment so proxies don't drop idle streams
+EVENTS_HEARTBEAT = 15
+
+@app.route("/api/events", methods=["GET"])
+@login_required
+def dashboard_events():
+    """Server-Sent Events for open dashboards.
+
+    Events: ``history`` (one new entry), ``history_cleared``, ``data``
+    (pages, templates, settings), ``counters`` (when they change) and
+    ``resync`` (the client fell behind and should reload). With a shared
+    state backend, history and data.json changes made by other workers
+    are picked up by polling every ``EVENTS_TICK`` seconds.
+    """
+    sub = event_bus.subscribe()
+    if sub is None:
+        return "Too many dashboard connections", 503
+    
+    def generate():
+        try:
+            recent = state.query_history(limit=1)
+            last_history_id = recent[0]["id"] if recent else 0
+            counters = None
+            started = last_sent = last_tick = time.monotonic()
+            yield f"retry: {int(EVENTS_TICK * 1000)}\n\n"
+            while time.monotonic() - started < EVENTS_MAX_AGE:
+                event = sub.get(timeout=EVENTS_TICK)
+                if sub.overflowed:
+                    yield format_sse("resync", {})
+                    return
+                out = []
+                if event is not None:
+                    kind, payload = event
+                    if kind != "history" or payload["id"] > last_history_id:
+                        if kind == "history":
+                            last_history_id = payload["id"]
+                        out.append(format_sse(kind, payload))
+                now = time.monotonic()
+                if now - last_tick >= EVENTS_TICK:
+                    last_tick = now
+                    if state.shared:
+                        # Another worker's writes never reach this process's bus
+                        reload_data_if_changed()
+                        for entry in reversed(state.query_history(limit=100)):
+                            if entry["id"] > last_history_id:
+                                last_history_id = entry["id"]
+                                out.append(format_sse("history", entry))
+                    current = dashboard_counters()
+                    if current != counters:
+                        counters = current
+                        out.append(format_sse("counters", counters))
+                if out:
+                    last_sent = now
+                    yield "".join(out)
+                elif now - last_sent >= EVENTS_HEARTBEAT:
+                    last_sent = now
+                    yield ": keep-alive\n\n"
+        finally:
+            event_bus.unsubscribe(sub)
+    
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text exposition of this worker process's metrics"""
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return "Forbidden", 403
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Largest page /api/history will return
+HISTORY_PAGE_MAX = 200
+
+@app.route("/api/history", methods=["GET"])
+@login_required
+def list_history():
+    """Newest-first history, one page per call.
+
+    Filters: ``page`` (page name), ``status``, ``since`` (inclusive) and
+    ``until`` (exclusive) as ``YYYY-MM-DD[ HH:MM:SS]``. Pass the returned
+    ``next`` back as ``before`` for the following page.
+    """
+    before = request.args.get("before", type=int)
+    limit = max(1, min(request.args.get("limit", 50, type=int), HISTORY_PAGE_MAX))
+    items = state.query_history(
+        before=before,
+        limit=limit + 1,
+        page=request.args.get("page") or None,
+        status=request.args.get("status") or None,
+        since=request.args.get("since") or None,
+        until=request.args.get("until") or None,
+    )
+    next_cursor = items[limit - 1]["id"] if len(items) > limit else None
+    return jsonify({"items": items[:limit], "next": next_cursor})
+
+@app.route("/api/history/stats", methods=["GET"])
+@login_required
+def history_stats():
+    """Per-day counts by status for the last ``days`` days"""
+    days = max(1, min(request.args.get("days", 7, type=int), HISTORY_DAILY_DAYS))
+    since = (datetime.now() - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    return jsonify({"days": state.daily_counts(since)})
+
 @app.route("/api/history", methods=["DELETE"])
 @login_required
 def clear_history():
-    global history
-    history = []
-    save_history()
+    state.clear_history()
+    event_bus.publish("history_cleared", {})
     return jsonify({"success": True})
 
 # ============ Webhook ============
@@ -1032,15 +1156,53 @@ def verify_webhook():
     challenge = request.args.get("hub.challenge")
     
     if mode == "subscribe" and token == VERIFY_TOKEN:
-        print("✅ Webhook verified!")
+        logger.info("✅ Webhook verified!")
         return challenge, 200
     return "Forbidden", 403
 
 @app.route("/webhook", methods=["POST"])
 def webhook_handler():
-    webhook_data = request.get_json()
-    print(f"📩 Webhook: {json.dumps(webhook_data, indent=2)}")
+    # Cheapest checks first: nothing is read or parsed for a request that will be rejected
+    if webhook_overloaded():
+        metrics.webhook_requests.inc(status=503)
+        return "Busy", 503
+    raw = admission.read_body(request)
+    if raw is None:
+        metrics.webhook_requests.inc(status=413)
+        return "Payload Too Large", 413
+    return accept_webhook(raw, request.headers.get("X-Hub-Signature-256"), request.remote_addr)
+
+def webhook_overloaded():
+    """True when no shard could take new work, checked before the body is read"""
+    return all(shard_overloaded(i) for i in range(len(delivery_queue.shards)))
+
+def shard_overloaded(index, jobs=0):
+    """True when shard ``index`` is past its share of WEBHOOK_SHED_BACKLOG or can't fit ``jobs`` more"""
+    shard = delivery_queue.shards[index]
+    threshold = admission.WEBHOOK_SHED_BACKLOG // len(delivery_queue.shards)
+    return (admission.overloaded(shard.depth() + retry_scheduler.pending(index), threshold)
+            or shard.free() < jobs)
+
+def accept_webhook(raw, signature, remote_addr):
+    """Verify, parse and enqueue one webhook body; returns ``(text, status)``.
+    Shared by the Flask route and the async entry point (asgi.py)."""
+    if not admission.verify_signature(raw, signature):
+        logger.warning("🚫 توقيع Webhook غير صالح من %s", remote_addr)
+        metrics.webhook_requests.inc(status=403)
+        return "Forbidden", 403
+    try:
+        webhook_data = json_loads(raw)
+    except ValueError:
+        webhook_data = None
+    if not isinstance(webhook_data, dict):
+        metrics.webhook_requests.inc(status=400)
+        return "Bad Request", 400
+    log_payload(logger, webhook_data)
+    webhook_capture.record(webhook_data)
     
+    # Only parse and enqueue here; Graph API calls run on the delivery queue
+    # so Facebook gets its 200 OK without waiting for them
+    jobs = []
     if webhook_data.get("object") == "page":
         for entry in webhook_data.get("entry", []):
             page_id = entry.get("id")
@@ -1058,26 +1220,38 @@ def webhook_handler():
                         
                         # Skip comments from the page itself (to avoid infinite loop)
                         if user_id == page_id:
-                            print(f"⏭️ تخطي: تعليق من الصفحة نفسها ({user_name})")
+                            logger.debug("⏭️ تخطي: تعليق من الصفحة نفسها (%s)", user_name)
                             continue
                         
-                        print(f"💬 New comment from {user_name}")
-                        reply_to_comment(comment_id, page_id, user_name)
-                        
-                        # Only send private reply for top-level comments (not replies to replies)
-                        # Check if parent_id equals post_id (means it's a direct comment on the post)
-                        if parent_id == post_id:
-                            send_private_reply(comment_id, page_id, user_name)
-                        else:
-                            print(f"⏭️ تخطي رسالة خاصة: تعليق على تعليق (ليس تعليق أساسي)")
+                        logger.debug("💬 New comment from %s", user_name)
+                        # parent_id equals post_id for a direct comment on the post
+                        top_level = parent_id == post_id
+                        # Direct comments jump ahead of reply chains when the queue backs up
+                        jobs.append((process_comment, (comment_id, page_id, user_name, top_level, post_id), page_id,
+                                     PRIORITY_NORMAL if top_level else PRIORITY_LOW))
+                        metrics.webhook_events.inc(kind="comment")
             
             for messaging in entry.get("messaging", []):
                 sender_id = messaging.get("sender", {}).get("id")
                 message = messaging.get("message", {})
                 
                 if message and sender_id != page_id:
-                    reply_to_message(sender_id, page_id)
+                    jobs.append((process_message, (message.get("mid"), sender_id, page_id), page_id, PRIORITY_NORMAL))
+                    metrics.webhook_events.inc(kind="message")
     
+    # Each shard sheds on its own backlog, and the whole payload is checked
+    # before any of it is queued so a 503 never follows a partial accept
+    per_shard = Counter(delivery_queue.index(key) for _, _, key, _ in jobs)
+    accepted = not any(shard_overloaded(index, count) for index, count in per_shard.items())
+    if accepted:
+        for func, args, key, priority in jobs:
+            accepted &= delivery_queue.submit(func, *args, key=key, priority=priority)
+    if not accepted:
+        # Queue is full: ask Facebook to redeliver later instead of losing events
+        logger.warning("⚠️ طابور الإرسال ممتلئ، سيعيد Facebook الإرسال لاحقاً")
+        metrics.webhook_requests.inc(status=503)
+        return "Busy", 503
+    metrics.webhook_requests.inc(status=200)
     return "OK", 200
 
 # ============ Run ============
@@ -1086,8 +1260,9 @@ if __name__ == "__main__":
     print("🚀 Facebook Webhooks Server with Dashboard")
     print("=" * 50)
     
-    load_data()
-    load_processed()  # Load processed comments to prevent duplicates
+    init_state()  # Load data, history and processed comments to prevent duplicates
+    if not admission.APP_SECRET:
+        print("⚠️ APP_SECRET غير مضبوط: لن يتم التحقق من توقيع الـ Webhooks")
     
     port = int(os.getenv("PORT", 5000))
     print(f"🌐 Server running on port {port}")
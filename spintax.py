@@ -0,0 +1,86 @@
+"""
+Spintax
+=======
+تحويل القالب مرة واحدة إلى شجرة، ثم توليد النص بمرور خطي واحد
+يدعم التداخل: {أهلاً|{مرحباً|هلا}} بك
+"""
+
+import random
+
+
+def compile_template(text):
+    """Parse ``text`` into a sequence of strings and choice tuples.
+
+    A sequence is a list whose parts are either plain strings or a tuple
+    of alternative sequences. Unmatched braces and empty ``{}`` stay as
+    literal text, like the old regex implementation.
+    """
+    pairs = _match_braces(text)
+    return _parse_sequence(text, 0, len(text), pairs)
+
+
+def _match_braces(text):
+    # A group only counts if everything between its braces is plain text or
+    # valid nested groups; stray or empty braces inside make it literal too
+    pairs = {}
+    stack = []
+    for i, ch in enumerate(text):
+        if ch == "{":
+            stack.append([i, False])
+        elif ch == "}" and stack:
+            start, dirty = stack.pop()
+            if i - start > 1 and not dirty:
+                pairs[start] = i
+            elif stack:
+                stack[-1][1] = True
+    return pairs
+
+
+def _parse_sequence(text, start, end, pairs):
+    parts = []
+    literal_start = start
+    i = start
+    while i < end:
+        close = pairs.get(i)
+        if close is None:
+            i += 1
+            continue
+        if literal_start < i:
+            parts.append(text[literal_start:i])
+        parts.append(_parse_choice(text, i + 1, close, pairs))
+        i = literal_start = close + 1
+    if literal_start < end:
+        parts.append(text[literal_start:end])
+    return parts
+
+
+def _parse_choice(text, start, end, pairs):
+    options = []
+    option_start = start
+    i = start
+    while i < end:
+        close = pairs.get(i)
+        if close is not None:
+            i = close + 1
+        elif text[i] == "|":
+            options.append(_parse_sequence(text, option_start, i, pairs))
+            i = option_start = i + 1
+        else:
+            i += 1
+    options.append(_parse_sequence(text, option_start, end, pairs))
+    return tuple(options)
+
+
+def render(sequence, choice=random.choice):
+    """Produce one random variant of a compiled template."""
+    out = []
+    _render(sequence, out, choice)
+    return "".join(out)
+
+
+def _render(sequence, out, choice):
+    for part in sequence:
+        if part.__class__ is str:
+            out.append(part)
+        else:
+            _render(choice(part), out, choice)
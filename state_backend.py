@@ -0,0 +1,545 @@
+"""
+State Backends
+==============
+تخزين حالة منع التكرار والسجل وحدود الردود بطريقتين:
+- local: داخل العملية نفسها (عامل gunicorn واحد)
+- sqlite: قاعدة SQLite مشتركة بين كل العمال (WAL)
+"""
+
+import os
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from history_store import history_store, HISTORY_RETENTION, HISTORY_COMPACT_INTERVAL, HISTORY_DAILY_DAYS
+from dedup_store import dedup_store, DEDUP_TTL
+from dead_letter_store import dead_letter_store, DEAD_LETTER_MAX
+from reply_budget import reply_budget
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "local")
+STATE_DB = os.getenv("STATE_DB", "state.db")
+# Finished background jobs are kept this long for the dashboard to poll
+JOB_TTL = 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FIELDS = ("time", "page", "action", "status", "details", "comment_id")
+HISTORY_COLUMNS = ("id",) + HISTORY_FIELDS
+DEAD_LETTER_FIELDS = ("id", "time", "page_id", "name", "path", "body", "status_code", "error", "attempts")
+
+
+class LocalBackend:
+    """Per-process state: the JSONL history log, dedup and dead letter stores, in-memory reply budgets."""
+
+    shared = False
+
+    def __init__(self, history=history_store, dedup=dedup_store, dead_letters=dead_letter_store, budget=reply_budget):
+        self.history = history
+        self.dedup = dedup
+        self.dead_letters = dead_letters
+        self.budget = budget
+        self.jobs = {}
+
+    def load(self):
+        self.history.load()
+        self.dedup.load()
+        self.dead_letters.load()
+
+    def claim(self, item_id):
+        return self.dedup.add(item_id)
+
+    def admit_reply(self, page_id, post_id, top_level=True):
+        return self.budget.admit(page_id, post_id, top_level)
+
+    def reply_budget_stats(self):
+        return self.budget.stats()
+
+    def append_history(self, entry):
+        self.history.append(entry)
+
+    def query_history(self, before=None, limit=50, page=None, status=None, since=None, until=None):
+        return self.history.query(before, limit, page, status, since, until)
+
+    def daily_counts(self, since):
+        return self.history.daily_counts(since)
+
+    def clear_history(self):
+        self.history.clear()
+
+    def add_dead_letter(self, entry):
+        self.dead_letters.add(entry)
+
+    def list_dead_letters(self, limit):
+        return self.dead_letters.list(limit)
+
+    def count_dead_letters(self):
+        return self.dead_letters.count()
+
+    def take_dead_letters(self, ids=None):
+        return self.dead_letters.take(ids)
+
+    def save_job(self, job):
+        self.jobs[job["id"]] = job
+        cutoff = time.time() - JOB_TTL
+        for job_id in [i for i, j in self.jobs.items() if (j["finished"] or time.time()) < cutoff]:
+            del self.jobs[job_id]
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+
+class SqliteBackend:
+    """State shared by every worker process through one SQLite file.
+
+    ``claim`` is a single upsert, so two workers racing on the same
+    comment ID can never both win. Reply budget windows are rows checked
+    and recorded in one write transaction, so the limits hold across
+    workers. Retention and TTL cleanup run on a background thread instead
+    of on the write path. On first use the local backend's files are
+    imported, so switching to several workers keeps history and dedup.
+    """
+
+    shared = True
+
+    def __init__(self, path=STATE_DB, retention=HISTORY_RETENTION, ttl=DEDUP_TTL,
+                 dead_letter_max=DEAD_LETTER_MAX, maintenance_interval=HISTORY_COMPACT_INTERVAL,
+                 daily_days=HISTORY_DAILY_DAYS, budget=reply_budget, history=history_store, dedup=dedup_store,
+                 dead_letters=dead_letter_store):
+        self.path = path
+        self.budget = budget
+        self.local = (history, dedup, dead_letters)
+        self.retention = retention
+        self.daily_days = daily_days
+        self.ttl = ttl
+        self.dead_letter_max = dead_letter_max
+        self.maintenance_interval = maintenance_interval
+        self._local = threading.local()
+        self._maintenance = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS processed (id TEXT PRIMARY KEY, ts REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS processed_ts ON processed (ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "time TEXT, page TEXT, action TEXT, status TEXT, details TEXT, comment_id TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS history_page ON history (page, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_status ON history (status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_time ON history (time)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history_daily ("
+            "day TEXT, status TEXT, count INTEGER NOT NULL, PRIMARY KEY (day, status))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, time TEXT, page_id TEXT, name TEXT, "
+            "path TEXT, body TEXT, status_code INTEGER, error TEXT, attempts INTEGER)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._import_local(conn)
+        if conn.execute("SELECT 1 FROM history_daily LIMIT 1").fetchone() is None:
+            # Databases from before the counters existed: backfill from the log
+            conn.execute(
+                "INSERT OR IGNORE INTO history_daily (day, status, count) "
+                "SELECT substr(time, 1, 10), status, COUNT(*) FROM history GROUP BY 1, 2"
+            )
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, updated REAL, data TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS reply_budget (scope TEXT, key TEXT, ts REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS reply_budget_key ON reply_budget (scope, key, ts)")
+        self._ensure_maintenance()
+
+    def _import_local(self, conn):
+        # One-time migration from the local backend's files into a new
+        # database, e.g. when gunicorn switches to sqlite for WEB_CONCURRENCY>1.
+        # IMMEDIATE makes workers starting together import once: the rest
+        # wait, then see the marker
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'local_import'").fetchone() is None:
+                # A database that is already in use keeps what it has
+                if not any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                           for table in ("history", "processed", "dead_letters")):
+                    self._copy_local(conn)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('local_import', ?)", (str(time.time()),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _copy_local(self, conn):
+        history, dedup, dead_letters = self.local
+        if _exists(history.path, history.legacy_path):
+            history.load()
+            conn.executemany(
+                f"INSERT OR IGNORE INTO history ({', '.join(HISTORY_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                [tuple(entry.get(k, "") for k in HISTORY_COLUMNS) for entry in history.entries],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO history_daily (day, status, count) VALUES (?, ?, ?)",
+                [(day, status, count) for day, counts in history.daily.items() for status, count in counts.items()],
+            )
+        if _exists(dedup.path, dedup.legacy_path):
+            dedup.load()
+            conn.executemany("INSERT OR IGNORE INTO processed (id, ts) VALUES (?, ?)", dedup.items())
+        if _exists(dead_letters.path):
+            dead_letters.load()
+            for entry in dead_letters.list(dead_letters.max_entries):
+                self.add_dead_letter(entry)
+        logger.info("📦 نُقلت الحالة المحلية إلى %s: %d سجل، %d تعليق معالج، %d رد فاشل", self.path,
+                    len(history.entries), len(dedup), dead_letters.count())
+
+    def claim(self, item_id):
+        return self.dedup.add(item_id)
+
+    def admit_reply(self, page_id, post_id, top_level=True):
+        return self.budget.admit(page_id, post_id, top_level)
+
+    def reply_budget_stats(self):
+        return self.budget.stats()
+
+    def append_history(self, entry):
+        self.history.append(entry)
+
+    def query_history(self, before=None, limit=50, page=None, status=None, since=None, until=None):
+        return self.history.query(before, limit, page, status, since, until)
+
+    def daily_counts(self, since):
+        return self.history.daily_counts(since)
+
+    def clear_history(self):
+        self.history.clear()
+
+    def add_dead_letter(self, entry):
+        self.dead_letters.add(entry)
+
+    def list_dead_letters(self, limit):
+        return self.dead_letters.list(limit)
+
+    def count_dead_letters(self):
+        return self.dead_letters.count()
+
+    def take_dead_letters(self, ids=None):
+        return self.dead_letters.take(ids)
+
+    def save_job(self, job):
+        self.jobs[job["id"]] = job
+        cutoff = time.time() - JOB_TTL
+        for job_id in [i for i, j in self.jobs.items() if (j["finished"] or time.time()) < cutoff]:
+            del self.jobs[job_id]
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+
+class SqliteBackend:
+    """State shared by every worker process through one SQLite file.
+
+    ``claim`` is a single upsert, so two workers racing on the same
+    comment ID can never both win. Reply budget windows are rows checked
+    and recorded in one write transaction, so the limits hold across
+    workers. Retention and TTL cleanup run on a background thread instead
+    of on the write path. On first use the local backend's files are
+    imported, so switching to several workers keeps history and dedup.
+    """
+
+    shared = True
+
+    def __init__(self, path=STATE_DB, retention=HISTORY_RETENTION, ttl=DEDUP_TTL,
+                 dead_letter_max=DEAD_LETTER_MAX, maintenance_interval=HISTORY_COMPACT_INTERVAL,
+                 daily_days=HISTORY_DAILY_DAYS, budget=reply_budget, history=history_store, dedup=dedup_store,
+                 dead_letters=dead_letter_store):
+        self.path = path
+        self.budget = budget
+        self.local = (history, dedup, dead_letters)
+        self.retention = retention
+        self.daily_days = daily_days
+        self.ttl = ttl
+        self.dead_letter_max = dead_letter_max
+        self.maintenance_interval = maintenance_interval
+        self._local = threading.local()
+        self._maintenance = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def load(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS processed (id TEXT PRIMARY KEY, ts REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS processed_ts ON processed (ts)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "time TEXT, page TEXT, action TEXT, status TEXT, details TEXT, comment_id TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS history_page ON history (page, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_status ON history (status, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_time ON history (time)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history_daily ("
+            "day TEXT, status TEXT, count INTEGER NOT NULL, PRIMARY KEY (day, status))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, time TEXT, page_id TEXT, name TEXT, "
+            "path TEXT, body TEXT, status_code INTEGER, error TEXT, attempts INTEGER)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._import_local(conn)
+        if conn.execute("SELECT 1 FROM history_daily LIMIT 1").fetchone() is None:
+            # Databases from before the counters existed: backfill from the log
+            conn.execute(
+                "INSERT OR IGNORE INTO history_daily (day, status, count) "
+                "SELECT substr(time, 1, 10), status, COUNT(*) FROM history GROUP BY 1, 2"
+            )
+        conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, updated REAL, data TEXT)")
+        conn.execute("CREATE TABLE IF NOT EXISTS reply_budget (scope TEXT, key TEXT, ts REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS reply_budget_key ON reply_budget (scope, key, ts)")
+        self._ensure_maintenance()
+
+    def _import_local(self, conn):
+        # One-time migration from the local backend's files into a new
+        # database, e.g. when gunicorn switches to sqlite for WEB_CONCURRENCY>1.
+        # IMMEDIATE makes workers starting together import once: the rest
+        # wait, then see the marker
+        history, dedup, dead_letters = self.local
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'local_import'").fetchone() is not None:
+                pass
+            elif any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                     for table in ("history", "processed", "dead_letters")):
+                # A database already in use (from before this import existed)
+                conn.execute("INSERT INTO meta (key, value) VALUES ('local_import', 'skipped')")
+            else:
+                if _exists(history.path, history.legacy_path):
+                    history.load()
+                    conn.executemany(
+                        f"INSERT OR IGNORE INTO history ({', '.join(HISTORY_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(HISTORY_COLUMNS))})",
+                        [tuple(entry.get(k, "") for k in HISTORY_COLUMNS) for entry in history.entries],
+                    )
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO history_daily (day, status, count) VALUES (?, ?, ?)",
+                        [(day, status, count) for day, counts in history.daily.items() for status, count in counts.items()],
+                    )
+                if _exists(dedup.path, dedup.legacy_path):
+                    dedup.load()
+                    conn.executemany("INSERT OR IGNORE INTO processed (id, ts) VALUES (?, ?)", dedup.items())
+                if _exists(dead_letters.path):
+                    dead_letters.load()
+                    for entry in dead_letters.list(dead_letters.max_entries):
+                        row = dict(entry, body=json.dumps(entry.get("body", {}), ensure_ascii=False))
+                        conn.execute(
+                            f"INSERT OR IGNORE INTO dead_letters ({', '.join(DEAD_LETTER_FIELDS)}) "
+                            f"VALUES ({', '.join('?' * len(DEAD_LETTER_FIELDS))})",
+                            tuple(row.get(k) for k in DEAD_LETTER_FIELDS),
+                        )
+                conn.execute("INSERT INTO meta (key, value) VALUES ('local_import', ?)", (str(time.time()),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def claim(self, item_id):
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO processed (id, ts) VALUES (?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET ts = excluded.ts WHERE processed.ts < ?",
+            (item_id, now, now - self.ttl),
+        )
+        return cur.rowcount == 1
+
+    def admit_reply(self, page_id, post_id, top_level=True):
+        checks = self.budget.checks(page_id, post_id, top_level)
+        exhausted = None
+        if checks:
+            now = time.time()
+            conn = self._conn()
+            # IMMEDIATE takes the write lock up front, so two workers can't
+            # both see the last free slot
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, key, limit in checks:
+                    count = conn.execute(
+                        "SELECT COUNT(*) FROM reply_budget WHERE scope = ? AND key = ? AND ts > ?",
+                        (name, key, now - self.budget.window),
+                    ).fetchone()[0]
+                    if count >= limit:
+                        exhausted = name
+                        break
+                else:
+                    conn.executemany("INSERT INTO reply_budget (scope, key, ts) VALUES (?, ?, ?)",
+                                     [(name, key, now) for name, key, _ in checks])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self.budget.count(exhausted)
+        return exhausted
+
+    def reply_budget_stats(self):
+        stats = self.budget.config()
+        conn = self._conn()
+        cutoff = time.time() - self.budget.window
+        busiest = conn.execute(
+            "SELECT key, COUNT(*) FROM reply_budget WHERE scope = 'post' AND ts > ? "
+            "GROUP BY key ORDER BY 2 DESC LIMIT 10", (cutoff,)
+        ).fetchall()
+        stats.update({
+            "tracked_posts": conn.execute(
+                "SELECT COUNT(DISTINCT key) FROM reply_budget WHERE scope = 'post' AND ts > ?", (cutoff,)
+            ).fetchone()[0],
+            "busiest_posts": [{"post_id": key, "replies": n} for key, n in busiest],
+            "pages": dict(conn.execute(
+                "SELECT key, COUNT(*) FROM reply_budget WHERE scope = 'page' AND ts > ? GROUP BY key", (cutoff,)
+            ).fetchall()),
+        })
+        return stats
+
+    def append_history(self, entry):
+        conn = self._conn()
+        cur = conn.execute(
+            "INSERT INTO history (time, page, action, status, details, comment_id) VALUES (?, ?, ?, ?, ?, ?)",
+            tuple(entry.get(k, "") for k in HISTORY_FIELDS),
+        )
+        entry["id"] = cur.lastrowid
+        conn.execute(
+            "INSERT INTO history_daily (day, status, count) VALUES (?, ?, 1) "
+            "ON CONFLICT(day, status) DO UPDATE SET count = count + 1",
+            (entry.get("time", "")[:10], entry.get("status", "")),
+        )
+
+    def query_history(self, before=None, limit=50, page=None, status=None, since=None, until=None):
+        where, params = [], []
+        for clause, value in (("id < ?", before), ("page = ?", page), ("status = ?", status),
+                              ("time >= ?", since), ("time < ?", until)):
+            if value is not None and value != "":
+                where.append(clause)
+                params.append(value)
+        rows = self._conn().execute(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history "
+            f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY id DESC LIMIT ?",
+            (*params, limit),
+        ).fetchall()
+        return [dict(zip(HISTORY_COLUMNS, row)) for row in rows]
+
+    def daily_counts(self, since):
+        counts = {}
+        for day, status, count in self._conn().execute(
+            "SELECT day, status, count FROM history_daily WHERE day >= ?", (since,)
+        ):
+            counts.setdefault(day, {})[status] = count
+        return counts
+
+    def clear_history(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM history")
+        conn.execute("DELETE FROM history_daily")
+
+    def add_dead_letter(self, entry):
+        row = dict(entry, body=json.dumps(entry.get("body", {}), ensure_ascii=False))
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO dead_letters ({', '.join(DEAD_LETTER_FIELDS)}) "
+            f"VALUES ({', '.join('?' * len(DEAD_LETTER_FIELDS))})",
+            tuple(row.get(k) for k in DEAD_LETTER_FIELDS),
+        )
+
+    def _dead_letter_rows(self, rows):
+        return [dict(zip(DEAD_LETTER_FIELDS, row), body=json.loads(row[5] or "{}")) for row in rows]
+
+    def list_dead_letters(self, limit):
+        rows = self._conn().execute(
+            f"SELECT {', '.join(DEAD_LETTER_FIELDS)} FROM dead_letters ORDER BY seq DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+        return self._dead_letter_rows(reversed(rows))
+
+    def count_dead_letters(self):
+        return self._conn().execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+
+    def take_dead_letters(self, ids=None):
+        # DELETE ... RETURNING keeps two workers from replaying the same letter
+        columns = ", ".join(DEAD_LETTER_FIELDS)
+        conn = self._conn()
+        if ids is None:
+            rows = conn.execute(f"DELETE FROM dead_letters RETURNING {columns}").fetchall()
+        else:
+            rows = []
+            for item_id in ids:
+                rows += conn.execute(f"DELETE FROM dead_letters WHERE id = ? RETURNING {columns}", (item_id,)).fetchall()
+        return self._dead_letter_rows(rows)
+
+    def save_job(self, job):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO jobs (id, updated, data) VALUES (?, ?, ?)",
+            (job["id"], time.time(), json.dumps(job, ensure_ascii=False)),
+        )
+
+    def get_job(self, job_id):
+        row = self._conn().execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def maintain(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM processed WHERE ts < ?", (time.time() - self.ttl,))
+        conn.execute(
+            "DELETE FROM history WHERE id <= (SELECT MAX(id) FROM history) - ?",
+            (self.retention,),
+        )
+        conn.execute(
+            "DELETE FROM dead_letters WHERE seq <= (SELECT MAX(seq) FROM dead_letters) - ?",
+            (self.dead_letter_max,),
+        )
+        conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - JOB_TTL,))
+        conn.execute("DELETE FROM reply_budget WHERE ts < ?", (time.time() - self.budget.window,))
+        conn.execute("DELETE FROM history_daily WHERE day < ?",
+                     ((date.today() - timedelta(days=self.daily_days)).isoformat(),))
+
+    def _ensure_maintenance(self):
+        if self._maintenance is not None or self.maintenance_interval <= 0:
+            return
+        self._maintenance = threading.Thread(target=self._maintenance_loop, name="state-maintenance", daemon=True)
+        self._maintenance.start()
+
+    def _maintenance_loop(self):
+        while True:
+            time.sleep(self.maintenance_interval)
+            try:
+                self.maintain()
+            except Exception as e:
+                logger.error("❌ فشل تنظيف قاعدة الحالة: %s", e)
+
+
+def _exists(*paths):
+    return any(os.path.exists(p) for p in paths)
+
+
+def create_backend(name=STATE_BACKEND):
+    if name == "sqlite":
+        return SqliteBackend()
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {name}")
@@ -0,0 +1,391 @@
+// Global variable to store fetched pages
+let fetchedPages = [];
+
+// Fetch Pages from Token
+async function fetchPages() {
+    const token = document.getElementById('user-token').value;
+    if (!token) {
+        alert('يرجى إدخال Access Token');
+        return;
+    }
+    
+    const btn = document.getElementById('fetch-btn');
+    btn.textContent = '⏳ جاري الجلب...';
+    btn.disabled = true;
+    
+    try {
+        const response = await fetch('/api/fetch-pages', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({token: token})
+        });
+        
+        if (!response.ok) {
+            const result = await response.json();
+            alert('خطأ: ' + (result.error || 'فشل جلب الصفحات'));
+        } else {
+            // NDJSON stream: one line per batch of pages, then a done/truncated/error line
+            fetchedPages = [];
+            displayFetchedPages([]);
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const {value, done} = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, {stream: true});
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line) continue;
+                    const chunk = JSON.parse(line);
+                    if (chunk.type === 'pages') {
+                        appendFetchedPages(chunk.pages);
+                        btn.textContent = `⏳ جاري الجلب... ${fetchedPages.length}`;
+                    } else if (chunk.type === 'truncated') {
+                        alert(`تم جلب أول ${chunk.total} صفحة فقط: توقف الجلب بعد ${chunk.max_requests} طلب (FETCH_PAGES_MAX_REQUESTS)`);
+                    } else if (chunk.type === 'error') {
+                        alert('خطأ: ' + chunk.error);
+                    }
+                }
+            }
+        }
+    } catch (e) {
+        alert('خطأ في الاتصال');
+    }
+    
+    btn.textContent = '📥 جلب الصفحات';
+    btn.disabled = false;
+}
+
+// Display fetched pages with checkboxes
+function displayFetchedPages(pages) {
+    const container = document.getElementById('fetched-pages-container');
+    const list = document.getElementById('fetched-pages-list');
+    
+    if (pages.length === 0) {
+        list.innerHTML = '<p style="color: #aaa;">لم يتم العثور على صفحات</p>';
+    } else {
+        list.innerHTML = pages.map((p, i) => `
+            <div class="list-item">
+                <label style="cursor: pointer; flex: 1;">
+                    <input type="checkbox" class="page-checkbox" data-index="${i}" checked>
+                    ${p.name}
+                </label>
+            </div>
+        `).join('');
+    }
+    
+    container.style.display = 'block';
+}
+
+// Append a streamed batch of pages to the fetched list
+function appendFetchedPages(pages) {
+    if (pages.length === 0) return;
+    const list = document.getElementById('fetched-pages-list');
+    if (fetchedPages.length === 0) list.innerHTML = '';
+    const start = fetchedPages.length;
+    fetchedPages.push(...pages);
+    list.insertAdjacentHTML('beforeend', pages.map((p, i) => `
+        <div class="list-item">
+            <label style="cursor: pointer; flex: 1;">
+                <input type="checkbox" class="page-checkbox" data-index="${start + i}" checked>
+                ${p.name}
+            </label>
+        </div>
+    `).join(''));
+}
+
+// Toggle all checkboxes
+function toggleAllFetched() {
+    const checked = document.getElementById('select-all-fetched').checked;
+    document.querySelectorAll('.page-checkbox').forEach(cb => cb.checked = checked);
+}
+
+// Add selected pages
+async function addSelectedPages() {
+    const selected = [];
+    document.querySelectorAll('.page-checkbox:checked').forEach(cb => {
+        const index = parseInt(cb.dataset.index);
+        selected.push(fetchedPages[index]);
+    });
+    
+    if (selected.length === 0) {
+        alert('يرجى تحديد صفحة واحدة على الأقل');
+        return;
+    }
+    
+    const response = await fetch('/api/pages/bulk', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({pages: selected})
+    });
+    const result = await response.json();
+    
+    alert(`تمت إضافة ${result.added} صفحة جديدة`);
+    refresh();
+}
+
+// Poll a background job until it finishes, collecting its results
+async function pollJob(jobId, onProgress) {
+    let results = [];
+    let offset = 0;
+    while (true) {
+        const response = await fetch(`/api/jobs/${jobId}?offset=${offset}`);
+        const job = await response.json();
+        if (!job.success) throw new Error(job.error);
+        results = results.concat(job.results);
+        offset = job.next_offset;
+        onProgress(job);
+        if (job.status === 'done') return results;
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+// Subscribe all pages to webhooks
+async function subscribeAllPages() {
+    if (!confirm('هل تريد تفعيل Webhooks لكل الصفحات المضافة؟')) {
+        return;
+    }
+    const subscribeBtn = document.getElementById('subscribe-btn');
+    subscribeBtn.disabled = true;
+    
+    try {
+        const response = await fetch('/api/pages/subscribe-all', {method: 'POST'});
+        const result = await response.json();
+        
+        if (result.success) {
+            // Subscription runs in the background; poll its progress
+            const results = await pollJob(result.job_id, (job) => {
+                subscribeBtn.textContent = `⏳ جاري التفعيل... ${job.completed}/${job.total}`;
+            });
+            const subscribed = results.filter(r => r.success).length;
+            let message = `تم تفعيل ${subscribed} من ${result.total} صفحة\n\n`;
+            results.forEach(r => {
+                message += r.success ? `✅ ${r.page}\n` : `❌ ${r.page}: ${r.error}\n`;
+            });
+            alert(message);
+            refresh();
+        } else {
+            alert('حدث خطأ أثناء التفعيل');
+        }
+    } catch (e) {
+        alert('خطأ في الاتصال');
+    }
+    subscribeBtn.disabled = false;
+}
+
+// Delete Page
+async function deletePage(id) {
+    if (confirm('هل أنت متأكد من حذف هذه الصفحة؟')) {
+        await fetch('/api/pages/' + id, {method: 'DELETE'});
+        refresh();
+    }
+}
+
+// Delete All Pages
+async function deleteAllPages() {
+    if (confirm('هل أنت متأكد من حذف جميع الصفحات؟')) {
+        // One request and one save instead of a DELETE per page
+        await fetch('/api/pages/bulk', {method: 'DELETE'});
+        refresh();
+    }
+}
+
+// Add Comment Template
+document.getElementById('add-comment-template-form').onsubmit = async (e) => {
+    e.preventDefault();
+    await fetch('/api/templates/comment', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({template: document.getElementById('comment-template').value})
+    });
+    document.getElementById('comment-template').value = '';
+    refresh();
+};
+
+// Add Message Template
+document.getElementById('add-message-template-form').onsubmit = async (e) => {
+    e.preventDefault();
+    await fetch('/api/templates/message', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({template: document.getElementById('message-template').value})
+    });
+    document.getElementById('message-template').value = '';
+    refresh();
+};
+
+// Delete Templates
+async function deleteCommentTemplate(index) {
+    await fetch('/api/templates/comment/' + index, {method: 'DELETE'});
+    refresh();
+}
+
+async function deleteMessageTemplate(index) {
+    await fetch('/api/templates/message/' + index, {method: 'DELETE'});
+    refresh();
+}
+
+// Toggle Setting
+async function toggleSetting(setting, el) {
+    el.classList.toggle('active');
+    await fetch('/api/settings', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({setting: setting, value: el.classList.contains('active')})
+    });
+}
+
+function historyRow(item) {
+    const row = document.createElement('tr');
+    for (const value of [item.time, item.page, item.action, item.status]) {
+        const cell = document.createElement('td');
+        cell.textContent = value;
+        row.appendChild(cell);
+    }
+    row.lastChild.className = item.status === 'نجاح' ? 'status-success' : 'status-error';
+    return row;
+}
+
+// History (loaded page by page from /api/history)
+let historyCursor = null;
+let historyLoading = false;
+
+async function loadHistory(reset) {
+    if (historyLoading) return;
+    historyLoading = true;
+    const table = document.getElementById('history-table');
+    if (reset) {
+        historyCursor = null;
+        table.innerHTML = '';
+    }
+    const params = new URLSearchParams({limit: 50});
+    const page = document.getElementById('history-page').value;
+    const status = document.getElementById('history-status').value;
+    if (page) params.set('page', page);
+    if (status) params.set('status', status);
+    if (historyCursor) params.set('before', historyCursor);
+    try {
+        const response = await fetch('/api/history?' + params);
+        const result = await response.json();
+        for (const item of result.items) {
+            table.appendChild(historyRow(item));
+        }
+        historyCursor = result.next;
+        document.getElementById('history-more').style.display = historyCursor ? 'block' : 'none';
+    } finally {
+        historyLoading = false;
+    }
+}
+
+document.getElementById('history-scroll').addEventListener('scroll', (e) => {
+    const el = e.target;
+    if (historyCursor && el.scrollTop + el.clientHeight >= el.scrollHeight - 50) loadHistory(false);
+});
+loadHistory(true);
+
+// Clear History
+async function clearHistory() {
+    if (confirm('هل أنت متأكد من مسح السجل؟')) {
+        await fetch('/api/history', {method: 'DELETE'});
+        refresh();
+    }
+}
+
+// Dead Letters
+async function replayDeadLetters() {
+    const response = await fetch('/api/dead-letters/replay', {method: 'POST'});
+    const result = await response.json();
+    alert(`تمت إعادة ${result.queued} من ${result.total} إلى طابور الإرسال`);
+    refresh();
+}
+
+async function deleteDeadLetters() {
+    if (confirm('هل أنت متأكد من حذف كل الردود الفاشلة؟')) {
+        await fetch('/api/dead-letters', {method: 'DELETE'});
+        refresh();
+    }
+}
+
+// Live updates from /api/events; without them, actions fall back to a reload
+let liveUpdates = false;
+
+function refresh() {
+    if (!liveUpdates) location.reload();
+}
+
+function listItem(text, onDelete) {
+    const item = document.createElement('div');
+    item.className = 'list-item';
+    const label = document.createElement('span');
+    label.textContent = text;
+    const button = document.createElement('button');
+    button.className = 'btn btn-danger';
+    button.textContent = '🗑️';
+    button.onclick = onDelete;
+    item.append(label, button);
+    return item;
+}
+
+function renderPages(pages) {
+    const list = document.getElementById('pages-list');
+    list.replaceChildren(...pages.map(p => {
+        const item = listItem(p.name, () => deletePage(p.id));
+        item.lastChild.style.padding = '5px 10px';
+        return item;
+    }));
+    document.getElementById('pages-list-count').textContent = pages.length;
+    document.getElementById('subscribe-box').style.display = pages.length ? '' : 'none';
+    
+    const select = document.getElementById('history-page');
+    const selected = select.value;
+    select.replaceChildren(select.options[0], ...pages.map(p => new Option(p.name, p.name)));
+    select.value = pages.some(p => p.name === selected) ? selected : '';
+}
+
+function renderTemplates(listId, templates, onDelete) {
+    document.getElementById(listId).replaceChildren(
+        ...templates.map((t, i) => listItem(t.slice(0, 50) + '...', () => onDelete(i)))
+    );
+}
+
+function connectEvents() {
+    if (!window.EventSource) return;
+    const events = new EventSource('/api/events');
+    events.onopen = () => { liveUpdates = true; };
+    events.onerror = () => { liveUpdates = false; };
+    
+    events.addEventListener('history', (e) => {
+        const item = JSON.parse(e.data);
+        const page = document.getElementById('history-page').value;
+        const status = document.getElementById('history-status').value;
+        if ((page && item.page !== page) || (status && item.status !== status)) return;
+        const table = document.getElementById('history-table');
+        table.prepend(historyRow(item));
+    });
+    events.addEventListener('history_cleared', () => {
+        document.getElementById('history-table').innerHTML = '';
+        historyCursor = null;
+        document.getElementById('history-more').style.display = 'none';
+    });
+    events.addEventListener('counters', (e) => {
+        const counters = JSON.parse(e.data);
+        document.getElementById('pages-count').textContent = counters.pages;
+        document.getElementById('replies-count').textContent = counters.replies_today;
+        document.getElementById('templates-count').textContent = counters.templates;
+        document.getElementById('dead-letters-count').textContent = counters.dead_letters;
+    });
+    events.addEventListener('data', (e) => {
+        const update = JSON.parse(e.data);
+        renderPages(update.pages);
+        renderTemplates('comment-templates-list', update.comment_templates, deleteCommentTemplate);
+        renderTemplates('message-templates-list', update.message_templates, deleteMessageTemplate);
+        document.querySelectorAll('.toggle[data-setting]').forEach(el => {
+            el.classList.toggle('active', Boolean(update.settings[el.dataset.setting]));
+        });
+    });
+    events.addEventListener('resync', () => location.reload());
+}
+
+connectEvents();
@@ -0,0 +1,88 @@
+"""
+Static Assets
+=============
+ملفات CSS/JS الخاصة بلوحة التحكم تُقرأ وتُضغط (gzip/brotli) مرة واحدة عند
+التشغيل، وتُرسل مع ETag و Cache-Control حتى لا يعيد المتصفح تحميلها
+"""
+
+import os
+import gzip
+import hashlib
+import mimetypes
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+# Versioned URLs (?v=<hash>) never change content, so browsers may keep them for a year
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 365 * 24 * 3600))
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class Asset:
+    def __init__(self, name, body):
+        self.name = name
+        self.body = body
+        self.version = hashlib.sha256(body).hexdigest()[:16]
+        self.etag = self.version
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.encoded = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(body, quality=11)
+
+
+class StaticAssets:
+    """Every file in ``directory``, loaded and precompressed once.
+
+    ``response()`` picks the smallest encoding the client accepts and
+    answers ``If-None-Match`` revalidations with 304.
+    """
+
+    def __init__(self, directory=STATIC_DIR, max_age=STATIC_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for name in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    assets[name] = Asset(name, f.read())
+        self.assets = assets
+
+    def url(self, name):
+        """Cache-busting URL for templates: ``/static/<name>?v=<hash>``."""
+        return f"/static/{name}?v={self.assets[name].version}"
+
+    def response(self, name, request, response_class):
+        asset = self.assets.get(name)
+        if asset is None:
+            return response_class("Not Found", status=404)
+
+        encoding = None
+        for candidate in ("br", "gzip"):
+            if candidate in asset.encoded and candidate in request.accept_encodings:
+                encoding = candidate
+                break
+
+        headers = {
+            # Each encoding is a different byte stream, so it gets its own ETag
+            "ETag": f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"',
+            "Vary": "Accept-Encoding",
+            "Cache-Control": (f"public, max-age={self.max_age}, immutable"
+                              if request.args.get("v") == asset.version else "public, no-cache"),
+        }
+        if request.if_none_match.contains(headers["ETag"].strip('"')):
+            return response_class(status=304, headers=headers)
+
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return response_class(asset.encoded.get(encoding, asset.body), mimetype=asset.mimetype, headers=headers)